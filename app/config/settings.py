@@ -148,6 +148,22 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+MEDIA_URL = "/media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Parsed uploads waiting for the "add" action; the directory must be shared
+# with the celery containers, which clean it up (staging_data volume)
+STAGING_ROOT = Path(os.getenv(ENV_PREFIX+'STAGING_ROOT', BASE_DIR / "staging"))
+STAGING_MAX_AGE = 24 * 60 * 60
+
+# Parsed supplier files keyed by content hash
+PARSE_CACHE_ROOT = BASE_DIR / "parsecache"
+PARSE_CACHE_MAX_SIZE = 200 * 1024 * 1024
+
+# Large .xlsx orders are read row by row in chunks
+EXCEL_CHUNK_SIZE = 10000
+ORDER_STREAMING_MIN_SIZE = 5 * 1024 * 1024
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -157,10 +173,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MODEL_SIGNALS = ['client', 'brand', 'product',
                  'order', 'confirmation', 'invoice']
 
+BULK_BATCH_SIZE = int(os.getenv(ENV_PREFIX+'BULK_BATCH_SIZE', 1000))
+
+# Values per __in list in ledger queries, below SQLite's variable limit
+LEDGER_CHUNK_SIZE = int(os.getenv(ENV_PREFIX+'LEDGER_CHUNK_SIZE', 400))
+
+# Rows fetched per cursor round trip while streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Reconciliation reports are cached per supplier until the ledger changes
+RECONCILIATION_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Rows per page of directory lists (keyset pagination)
+DIRECTORY_PAGE_SIZE = 100
+
+# Results per page of product search
+SEARCH_PAGE_SIZE = 20
+
+# Options returned to autocomplete select widgets
+AUTOCOMPLETE_LIMIT = 20
+
+# JSON API pages
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
 CELERY_TIMEZONE = 'UTC'
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_TASK_IGNORE_RESULT = False
+CELERY_TASK_ALWAYS_EAGER = False
+CELERY_BEAT_SCHEDULE = {
+    'clean-staging': {
+        'task': 'ordertrack_app.tasks.clean_staging',
+        'schedule': 60 * 60,
+    },
+}
 
 LOGGING = {
     'version': 1,
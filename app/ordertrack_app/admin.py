@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.http import HttpResponse
 from django.core import serializers
+from django.db.models import Prefetch
 
+from .search import search_products
 from .models import (
     Client,
     Brand,
@@ -14,6 +17,9 @@ from .models import (
     Confirmation,
     ConfirmationItem,
     ConfirmationDelivery,
+    ImportJob,
+    FulfilmentLedger,
+    CurrentPrice,
 )
 
 
@@ -80,8 +86,23 @@ class ProductAdmin(admin.ModelAdmin):
 
     actions = (revert_state,)
 
+    def get_search_results(self, request, queryset, search_term):
+        # поиск по индексу товаров вместо icontains по search_fields
+        if not search_term.strip():
+            return queryset, False
+        results = search_products(search_term, queryset)
+        # порядок совпадения (точный код первым) - только без сортировки по столбцу
+        if request.GET.get(ORDER_VAR):
+            results = results.order_by(*queryset.query.order_by)
+        return results, False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("brand").prefetch_related(
+            Prefetch("current_prices",
+                     queryset=CurrentPrice.objects.select_related("supplier")))
+
     def prices(self, obj):
-        return [f"{o.price} - {o.pricelist.state} " for o in obj.details.all()]
+        return [f"{o.price} - {o.supplier.name} " for o in obj.current_prices.all()]
 
 
 @admin.register(ProductDetail)
@@ -181,3 +202,41 @@ class ConfirmationDeliveryAdmin(admin.ModelAdmin):
     fields = ("confirmation", "product", "quantity", "delivery_date", )
     verbose_name = "ConfirmationDelivery"
     verbose_name_plural = "ConfirmationDeliveries"
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("filename", "kind", "status", "rows_parsed",
+                    "rows_written", "created_at", "duration")
+    ordering = ("-created_at",)
+    search_fields = ("filename",)
+    search_help_text = ("Search file name")
+    list_filter = ("kind", "status")
+    show_full_result_count = True
+    readonly_fields = ("kind", "status", "file", "filename", "form_data", "object_id",
+                       "rows_parsed", "rows_written", "errors", "started_at", "finished_at")
+
+
+@admin.register(FulfilmentLedger)
+class FulfilmentLedgerAdmin(admin.ModelAdmin):
+    list_display = ("order", "client", "product", "ordered",
+                    "confirmed", "invoiced", "cancelled", "open")
+    ordering = ("order", "client", "product")
+    search_fields = ("order__id", "client__id", "product__id")
+    search_help_text = ("Search order, client or product id")
+    list_select_related = ("order", "client", "product")
+    show_full_result_count = True
+    readonly_fields = ("order", "client", "product", "ordered",
+                       "confirmed", "invoiced", "cancelled", "open")
+
+
+@admin.register(CurrentPrice)
+class CurrentPriceAdmin(admin.ModelAdmin):
+    list_display = ("product", "supplier", "price", "starts_from", "pricelist")
+    ordering = ("supplier", "product")
+    search_fields = ("product__id", "product__name")
+    search_help_text = ("Search product id or name")
+    list_filter = ("supplier__name",)
+    list_select_related = ("product", "supplier", "pricelist")
+    show_full_result_count = True
+    readonly_fields = ("product", "supplier", "pricelist", "price", "starts_from")
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db.models import F, DecimalField, ExpressionWrapper
+
+from openpyxl import Workbook
+import csv
+import tempfile
+import zipfile
+
+from .models import ConfirmationItem
+from .forms.parsers import batched
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# столбец файла и поле строки подтверждения в values_list()
+CONFIRMATION_COLUMNS = [
+    ("client", "client_id"),
+    ("client_name", "client__name"),
+    ("product", "product_id"),
+    ("product_name", "product__name"),
+    ("quantity", "quantity"),
+    ("price", "price"),
+    ("total_price", "total_price"),
+    ("comment", "comment"),
+]
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "zip": "application/zip",
+}
+
+
+def confirmation_rows(confirmation_id):
+    # строки читаются курсором кусками по EXPORT_CHUNK_SIZE, без формсета и моделей
+    return ConfirmationItem.objects.filter(
+        confirmation_id=confirmation_id
+    ).annotate(
+        total_price=ExpressionWrapper(
+            F('quantity') * F('price'), output_field=DecimalField())
+    ).order_by("-client_id", "pk").values_list(
+        *(field for _, field in CONFIRMATION_COLUMNS)
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+class Echo:
+    """Файловый объект для csv.writer: записанная строка сразу возвращается."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(rows):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel открыл файл в UTF-8
+    yield "\ufeff" + writer.writerow([name for name, _ in CONFIRMATION_COLUMNS])
+    for chunk in batched(rows, settings.EXPORT_CHUNK_SIZE):
+        yield "".join(writer.writerow(row) for row in chunk)
+
+
+def excel_file(rows, header=None):
+    # write-only книга сбрасывает строки на диск, в памяти их не держит;
+    # xlsx - zip с оглавлением в конце, поэтому отдается из временного файла
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header or [name for name, _ in CONFIRMATION_COLUMNS])
+    for row in rows:
+        sheet.append(row)
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+    return file
+
+
+def file_chunks(file):
+    with file:
+        yield from iter(lambda: file.read(FILE_CHUNK_SIZE), b"")
+
+
+def confirmation_file_chunks(confirmation_id, file_format):
+    # содержимое файла подтверждения в байтах, кусками
+    if file_format == "csv":
+        return (chunk.encode() for chunk in csv_chunks(
+            confirmation_rows(confirmation_id)))
+    return file_chunks(excel_file(confirmation_rows(confirmation_id)))
+
+
+class StreamBuffer:
+    """
+    Файловый объект без seek и tell: zipfile пишет в него с дескрипторами
+    данных, а генератор забирает накопленные байты.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def zip_chunks(entries):
+    # entries - пары (имя файла, куски содержимого); каждый файл
+    # строится только когда до него доходит очередь
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            # размер файла заранее неизвестен, zip64 нужен для файлов больше 2 ГБ
+            with archive.open(name, "w", force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    if data := buffer.pop():
+                        yield data
+            if data := buffer.pop():
+                yield data
+    yield buffer.pop()
+
+
+def confirmations_zip_chunks(confirmation_ids, file_format):
+    return zip_chunks(
+        (f"{confirmation_id}.{file_format}",
+         confirmation_file_chunks(confirmation_id, file_format))
+        for confirmation_id in confirmation_ids)
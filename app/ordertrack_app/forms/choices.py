@@ -0,0 +1,121 @@
+from django import forms
+from django.urls import reverse
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+
+class SharedChoicesSelect(forms.Select):
+    """
+    Select, варианты которого общие для всех форм формсета: HTML вариантов
+    строится один раз, в каждой строке меняется только выбранное значение.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shared = None
+
+    def render_option(self, value, label):
+        # начало и конец тега, между ними вставляется selected
+        option = self.create_option(None, value, label, False, 0)
+        return (format_html('<option value="{}"', option['value']),
+                format_html('{}>{}</option>', flatatt(option['attrs']), option['label']))
+
+    def render(self, name, value, attrs=None, renderer=None):
+        if self.shared is None:
+            return super().render(name, value, attrs, renderer)
+        if self.shared["options"] is None:
+            self.shared["options"] = [
+                (str(option_value), self.render_option(option_value, label))
+                for option_value, label in self.choices]
+        selected = set(self.format_value(value))
+        options = "".join(
+            head + (" selected" if option_value in selected else "") + tail
+            for option_value, (head, tail) in self.shared["options"])
+        return format_html('<select name="{}"{}>{}</select>',
+                           name, flatatt(self.build_attrs(self.attrs, attrs)),
+                           mark_safe(options))
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Select только с выбранными вариантами: остальные подгружаются по мере
+    ввода из ответа autocomplete, размер страницы не зависит от справочника.
+    Проверка значения остается на стороне поля формы.
+    """
+
+    def __init__(self, model_name, attrs=None):
+        super().__init__(attrs)
+        self.model_name = model_name
+        # {pk: подпись} выбранных значений, заполняется формсетом
+        self.labels = None
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs["data-autocomplete-url"] = reverse(
+            "autocomplete", kwargs={"model": self.model_name})
+        return attrs
+
+    def selected_labels(self, values):
+        if self.labels is not None:
+            return {value: self.labels[value] for value in values if value in self.labels}
+        if not values:
+            return {}
+        field = self.choices.field
+        return {str(obj.pk): field.label_from_instance(obj)
+                for obj in self.choices.queryset.filter(pk__in=values)}
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [option_value for option_value in value if option_value]
+        options = []
+        empty_label = getattr(self.choices.field, "empty_label", None)
+        if not self.allow_multiple_selected and empty_label is not None:
+            options.append(self.create_option(name, "", empty_label, not selected, 0))
+        for option_value, label in self.selected_labels(selected).items():
+            options.append(self.create_option(
+                name, option_value, label, True, len(options)))
+        return [(None, options, 0)]
+
+
+class AutocompleteSelectMultiple(AutocompleteSelect, forms.SelectMultiple):
+    allow_multiple_selected = True
+
+
+class SharedChoicesFormSetMixin:
+    """Варианты полей shared_choice_fields выбираются одним запросом на формсет."""
+    shared_choice_fields = ()
+
+    def get_choice_querysets(self):
+        return {}
+
+    def share_choices(self):
+        if not self.forms:
+            return
+        querysets = self.get_choice_querysets()
+        for name in self.shared_choice_fields:
+            field = self.forms[0].fields[name]
+            queryset = querysets.get(name, field.queryset)
+            if isinstance(field.widget, AutocompleteSelect):
+                self.share_labels(name, queryset)
+                continue
+            choices = [(str(obj.pk), field.label_from_instance(obj))
+                       for obj in queryset]
+            if field.empty_label is not None:
+                choices.insert(0, ("", field.empty_label))
+            shared = {"options": None}
+            for form in self.forms:
+                form.fields[name].queryset = queryset
+                form.fields[name].choices = choices
+                if isinstance(form.fields[name].widget, SharedChoicesSelect):
+                    form.fields[name].widget.shared = shared
+
+    def share_labels(self, name, queryset):
+        # подписи выбранных значений всех строк - одним запросом
+        values = {str(form[name].value()) for form in self.forms
+                  if form[name].value() not in (None, "")}
+        field = self.forms[0].fields[name]
+        labels = {str(obj.pk): field.label_from_instance(obj)
+                  for obj in queryset.filter(pk__in=values)} if values else {}
+        for form in self.forms:
+            form.fields[name].queryset = queryset
+            form.fields[name].widget.labels = labels
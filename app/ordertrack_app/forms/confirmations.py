@@ -4,11 +4,11 @@ from django.forms import BaseModelFormSet
 from django.db.models import Sum
 
 from datetime import date
-import pandas as pd
-from io import BytesIO
 
 
 from ..models import Confirmation, ConfirmationItem, Supplier, Product, Client
+from .choices import (
+    SharedChoicesSelect, SharedChoicesFormSetMixin, AutocompleteSelect, AutocompleteSelectMultiple)
 
 import logging
 
@@ -32,8 +32,8 @@ class ConfirmationModelForm(forms.ModelForm):
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input confirmation name'}),
             'confirmation_code': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input confirmation code'}),
             'confirmation_date': forms.DateInput(attrs={'class': 'form-control', 'placeholder': 'Input confirmation date'}),
-            'supplier': forms.Select(attrs={'class': 'form-control', 'data-initial': lambda: Supplier.objects.get(id="T00016")}),
-            'order': forms.SelectMultiple(attrs={'class': 'form-control'}),
+            'supplier': AutocompleteSelect("supplier", attrs={'class': 'form-control', 'data-initial': lambda: Supplier.objects.get(id="T00016")}),
+            'order': AutocompleteSelectMultiple("order", attrs={'class': 'form-control'}),
             'comment': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input comment'}),
         }
 
@@ -76,7 +76,7 @@ class BaseConfirmationModelForm(forms.ModelForm):
         }
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': ''}),
-            'order': forms.SelectMultiple(attrs={'class': 'form-control'}),
+            'order': AutocompleteSelectMultiple("order", attrs={'class': 'form-control'}),
             'comment': forms.TextInput(attrs={'class': 'form-control', 'placeholder': ''}),
         }
 
@@ -96,25 +96,16 @@ class EditConfirmationModelForm(ViewConfirmationModelForm):
         self.fields['comment'].widget.attrs['disabled'] = False
 
 
-class ProductPriceSelectWidget(forms.Select):
-    def __init__(self, confirmation=None, *args, **kwargs):
+class ProductPriceSelectWidget(SharedChoicesSelect):
+    def __init__(self, prices=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.confirmation = confirmation
+        # словарь {product_id: price}, заполняется формсетом
+        self.prices = prices or {}
 
     def create_option(self, name, value, label, selected, index, **kwargs):
         option = super().create_option(name, value, label, selected, index, **kwargs)
-        if value and self.confirmation:
-            try:
-                confirmation_item = ConfirmationItem.objects.filter(
-                    confirmation=self.confirmation,
-                    product_id=value
-                ).first()
-                if confirmation_item:
-                    price = confirmation_item.price
-                    option['attrs']['data-price'] = f'{price}'
-            except Exception as e:
-                log.info(
-                    'No price for %s : %s', value, str(e))
+        if value and (price := self.prices.get(str(value))) is not None:
+            option['attrs']['data-price'] = f'{price}'
         return option
 
 
@@ -129,7 +120,7 @@ class BaseConfirmationItemModelForm(forms.ModelForm):
             'price': 'Price',
         }
         widgets = {
-            'product': ProductPriceSelectWidget(confirmation=None, attrs={'class': 'form-control'}),
+            'product': ProductPriceSelectWidget(attrs={'class': 'form-control'}),
             'quantity': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'min': 1,
@@ -138,7 +129,7 @@ class BaseConfirmationItemModelForm(forms.ModelForm):
             }),
             'price':  forms.NumberInput(attrs={
                 'class': 'form-control'}),
-            'client': forms.Select(attrs={'class': 'form-control'}),
+            'client': SharedChoicesSelect(attrs={'class': 'form-control'}),
         }
 
 
@@ -161,29 +152,43 @@ class EditConfirmationItemModelForm(ViewConfirmationItemModelForm):
         self.fields['product'].widget.attrs['disabled'] = False
 
 
-class ConfirmationItemFormSet(BaseModelFormSet):
+class ConfirmationItemFormSet(SharedChoicesFormSetMixin, BaseModelFormSet):
+    shared_choice_fields = ('client', 'product')
+
     def __init__(self, *args, **kwargs):
         confirmation = kwargs.pop('form_kwargs', {}).get('confirmation')
+        # queryset из представления (с select_related) используется как есть
+        if kwargs.get('queryset') is None:
+            kwargs['queryset'] = ConfirmationItem.objects.filter(
+                confirmation=confirmation)
         super().__init__(*args, **kwargs)
         self.confirmation = confirmation
-        self.queryset = ConfirmationItem.objects.filter(
-            confirmation=confirmation)
         self.deletion_widget = forms.CheckboxInput({
             'onclick': 'return confirm("Do you really want to delete the record?");'
         })
         self._initialize_widgets()
 
+    def get_price_map(self):
+        # цена товара - из первой строки подтверждения с этим товаром
+        return dict(ConfirmationItem.objects.filter(
+            confirmation=self.confirmation
+        ).order_by('-pk').values_list('product_id', 'price'))
+
+    def get_choice_querysets(self):
+        return {
+            'product': Product.objects.filter(
+                confirmed__confirmation=self.confirmation
+            ).distinct(),
+            'client': Client.objects.filter(
+                confirmed_products__confirmation=self.confirmation
+            ).distinct(),
+        }
+
     def _initialize_widgets(self):
-        products = Product.objects.filter(
-            confirmed__confirmation=self.confirmation
-        ).distinct()
-        clients = Client.objects.filter(
-            confirmed_products__confirmation=self.confirmation
-        ).distinct()
+        prices = self.get_price_map()
         for form in self.forms:
-            form.fields['product'].widget.confirmation = self.confirmation
-            form.fields['product'].queryset = products
-            form.fields['client'].queryset = clients
+            form.fields['product'].widget.prices = prices
+        self.share_choices()
 
     def add_fields(self, form, index):
         super().add_fields(form, index)
@@ -237,17 +242,34 @@ class ConfirmationItemFormSet(BaseModelFormSet):
         self.__check_items_initial()
         self.__check_client_product_unique()
 
-    def export_to_excel(self):
-        df = pd.DataFrame([
-            dict(form.initial.items())
-            for form in self.forms
-        ])
-        if df.empty:
-            return None
-        excel_file = BytesIO()
-        df.to_excel(excel_file, index=False)
-        excel_file.seek(0)
-        return excel_file
+
+class ExportConfirmationsForm(forms.Form):
+    """Выбор подтверждений для выгрузки архивом."""
+    supplier = forms.ModelChoiceField(
+        queryset=Supplier.objects.all(), required=False,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    format = forms.ChoiceField(
+        choices=[("xlsx", "Excel"), ("csv", "CSV")], initial="xlsx", required=False,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+
+    def clean_format(self):
+        return self.cleaned_data.get("format") or "xlsx"
+
+    def confirmation_ids(self):
+        confirmations = Confirmation.objects.order_by("confirmation_date", "id")
+        if supplier := self.cleaned_data.get("supplier"):
+            confirmations = confirmations.filter(supplier=supplier)
+        if date_from := self.cleaned_data.get("date_from"):
+            confirmations = confirmations.filter(confirmation_date__gte=date_from)
+        if date_to := self.cleaned_data.get("date_to"):
+            confirmations = confirmations.filter(confirmation_date__lte=date_to)
+        return list(confirmations.values_list("id", flat=True))
 
 
 ViewConfirmationItemFormSet = forms.modelformset_factory(
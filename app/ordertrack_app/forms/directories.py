@@ -0,0 +1,40 @@
+from django import forms
+from django.db.models import Exists, OuterRef
+
+from ..models import Brand, Supplier, Product, ProductDetail
+from ..search import product_matches
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ProductFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False, max_length=200,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control form-control-sm', 'placeholder': 'Code or name'}))
+    brand = forms.ModelChoiceField(
+        queryset=Brand.objects.all(), required=False,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+    supplier = forms.ModelChoiceField(
+        queryset=Supplier.objects.all(), required=False,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+    state = forms.ChoiceField(
+        choices=[("", "---------")] + Product.State.choices, required=False,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+
+    def filter(self, queryset):
+        # фильтры выполняются в SQL, до пагинации
+        if not self.is_valid():
+            return queryset
+        if query := self.cleaned_data.get("q", "").strip():
+            queryset = queryset.filter(product_matches(query))
+        if brand := self.cleaned_data.get("brand"):
+            queryset = queryset.filter(brand=brand)
+        if supplier := self.cleaned_data.get("supplier"):
+            queryset = queryset.filter(Exists(ProductDetail.objects.filter(
+                product=OuterRef("pk"), pricelist__supplier=supplier)))
+        if state := self.cleaned_data.get("state"):
+            queryset = queryset.filter(state=state)
+        return queryset
@@ -0,0 +1,40 @@
+from datetime import date
+from django import forms
+from django.core.exceptions import ValidationError
+
+from ..models import Invoice
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class InvoiceModelForm(forms.ModelForm):
+    class Meta:
+        model = Invoice
+        fields = ['name', 'invoice_date', 'supplier', 'comment']
+        labels = {
+            'name': 'Name',
+            'invoice_date': 'Date',
+            'supplier': 'Supplier',
+            'comment': 'Comment',
+        }
+        help_texts = {
+            'name': 'Invoice number from the file, if empty',
+        }
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input invoice name'}),
+            'invoice_date': forms.DateInput(attrs={'class': 'form-control', 'placeholder': 'Input invoice date'}),
+            'supplier': forms.Select(attrs={'class': 'form-control'}),
+            'comment': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input comment'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['name'].required = False
+
+    def clean_invoice_date(self):
+        invoice_date = self.cleaned_data.get('invoice_date')
+        if invoice_date > date.today():
+            raise ValidationError("Invoice date should be past")
+        return invoice_date
@@ -1,11 +1,13 @@
 from datetime import date
 from django import forms
 from django.core.exceptions import ValidationError
+from django.forms import BaseModelFormSet
 
 from ..models import (
     OrderItem,
     Order,
 )
+from .choices import AutocompleteSelect, SharedChoicesFormSetMixin
 
 import logging
 
@@ -25,7 +27,7 @@ class OrderModelForm(forms.ModelForm):
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input order name'}),
             'order_date': forms.DateInput(attrs={'class': 'form-control', 'placeholder': 'Input order date'}),
-            'supplier': forms.Select(attrs={'class': 'form-control'}),
+            'supplier': AutocompleteSelect("supplier", attrs={'class': 'form-control'}),
             'comment': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input comment'}),
         }
 
@@ -84,9 +86,9 @@ class BaseOrderItemModelForm(forms.ModelForm):
         }
         widgets = {
             'id': forms.HiddenInput(),
-            'order': forms.Select(attrs={'class': 'form-control'}),
-            'client': forms.Select(attrs={'class': 'form-control'}),
-            'product': forms.Select(attrs={'class': 'form-control'}),
+            'order': AutocompleteSelect("order", attrs={'class': 'form-control'}),
+            'client': AutocompleteSelect("client", attrs={'class': 'form-control'}),
+            'product': AutocompleteSelect("product", attrs={'class': 'form-control'}),
             'quantity': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'min': 1,
@@ -113,9 +115,18 @@ class EditOrderItemModelForm(ViewOrderItemModelForm):
         self.fields['product'].widget.attrs['disabled'] = False
 
 
+class OrderItemFormSet(SharedChoicesFormSetMixin, BaseModelFormSet):
+    shared_choice_fields = ('order', 'client', 'product')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.share_choices()
+
+
 ViewOrderItemFormSet = forms.modelformset_factory(
     OrderItem,
     form=ViewOrderItemModelForm,
+    formset=OrderItemFormSet,
     extra=0,
 )
 
@@ -123,5 +134,6 @@ ViewOrderItemFormSet = forms.modelformset_factory(
 EditOrderItemFormSet = forms.modelformset_factory(
     OrderItem,
     form=EditOrderItemModelForm,
+    formset=OrderItemFormSet,
     can_delete=True,
 )
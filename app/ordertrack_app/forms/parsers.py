@@ -0,0 +1,346 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+import pandas as pd
+from openpyxl import load_workbook
+from itertools import islice
+import re
+
+from ..models import Brand, Product
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# значения, которые pd.read_excel по умолчанию считает пустыми
+NA_VALUES = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+}
+
+
+def cell_to_str(value):
+    # приведение значения ячейки так же, как pd.read_excel(dtype=str)
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value)
+    if value in NA_VALUES:
+        return None
+    return value
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def read_excel_chunks(uploaded_file, chunk_size):
+    # чтение листа построчно, в памяти не больше chunk_size строк
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f"Unnamed: {i}" if value is None else str(value)
+                   for i, value in enumerate(header)]
+        for chunk in batched(rows, chunk_size):
+            yield pd.DataFrame(
+                [[cell_to_str(value) for value in row] for row in chunk],
+                columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+class CodeRules:
+    """Нормализация кодов товаров и клиентов поставщика."""
+
+    def __init__(self, strip_chars=".", zfill=None):
+        self.strip_pattern = re.compile(f"[{re.escape(strip_chars)}]")
+        self.zfill = zfill or {}
+
+    def product(self, codes, brand_id):
+        return codes.astype(str).str.replace(
+            self.strip_pattern, "", regex=True) + f"_{brand_id}"
+
+    def pad(self, codes, brand_id):
+        if width := self.zfill.get(brand_id):
+            return codes.str.zfill(width)
+        return codes
+
+    def client(self, codes):
+        return codes.str.replace(self.strip_pattern, "", regex=True).str.upper()
+
+
+class OrderParser:
+    """
+    Разбор файла заказа: первый столбец - код товара, второй - второй код
+    (если количество в третьем столбце), клиент - из столбца client_column
+    или из имени файла.
+    """
+
+    def __init__(self, supplier_id, client_part=1, brand_part=2,
+                 quantity_column="quantity", client_column="note",
+                 codes=None):
+        self.supplier_id = supplier_id
+        self.client_part = client_part
+        self.brand_part = brand_part
+        self.quantity_column = quantity_column
+        self.client_column = client_column
+        self.codes = codes or CodeRules()
+
+    def name_codes(self, filename):
+        parts = [part.replace(".", "").replace(" ", "").upper()
+                 for part in filename.split("-")]
+        return parts[self.brand_part], parts[self.client_part]
+
+    def group(self, df, brand_id, client_id):
+        df.columns = df.columns.str.lower()
+        df.dropna(inplace=True)
+        if self.client_column in df.columns.values:
+            df["client"] = self.codes.client(df[self.client_column])
+        else:
+            df["client"] = client_id
+        df.rename(columns={df.columns.values[0]: 'product'}, inplace=True)
+        df['product'] = self.codes.product(df['product'], brand_id)
+        if df.columns.get_loc(self.quantity_column) == 2:
+            df.rename(
+                columns={df.columns.values[1]: 'second_id'}, inplace=True)
+            df["second_id"] = self.codes.product(df["second_id"], brand_id)
+        else:
+            df["second_id"] = df["product"]
+        df['quantity'] = pd.to_numeric(df[self.quantity_column])
+        df['product'] = self.codes.pad(df['product'], brand_id)
+        return df.groupby(["product", "second_id", "client", ])[
+            "quantity"].sum()
+
+    def parse(self, uploaded_file, streaming=False):
+        brand_id, client_id = self.name_codes(uploaded_file.name)
+        if streaming:
+            # частичные суммы по каждому куску складываются в конце
+            df = pd.concat([
+                self.group(chunk, brand_id, client_id)
+                for chunk in read_excel_chunks(
+                    uploaded_file, settings.EXCEL_CHUNK_SIZE)
+            ]).groupby(level=[0, 1, 2]).sum()
+        else:
+            df = self.group(
+                pd.read_excel(uploaded_file, parse_dates=True, dtype=str,),
+                brand_id, client_id)
+        df.loc['total'] = df.sum()
+        df = df.reset_index()
+        df.columns = ['product', "second_id", 'client', 'quantity',]
+        return df
+
+
+class ConfirmationParser:
+    """
+    Разбор подтверждения: код подтверждения находится справа от code_anchor,
+    таблица товаров начинается со строки table_anchor и заканчивается первой
+    пустой ячейкой в ее первом столбце.
+    """
+
+    def __init__(self, supplier_id, code_anchor, table_anchor, columns,
+                 brand_part=1, date_format=None, codes=None):
+        self.supplier_id = supplier_id
+        self.code_anchor = code_anchor
+        self.table_anchor = table_anchor
+        self.columns = columns
+        self.brand_part = brand_part
+        self.date_format = date_format
+        self.codes = codes or CodeRules()
+
+    def brand_id(self, filename):
+        brand = filename.split(" ")[self.brand_part]
+        if brand_id := Brand.objects.filter(
+                name__icontains=brand).values_list('id', flat=True).first():
+            return brand_id
+        raise ValidationError(f"Brand {brand} must be in Brands")
+
+    @staticmethod
+    def find_anchor(df, anchor, substring):
+        # по столбцам слева направо, как раньше в __find_next_value
+        for column in range(df.shape[1]):
+            values = df.iloc[:, column]
+            if values.dtype != object:
+                continue
+            if substring:
+                found = values.map(lambda x: isinstance(x, str) and anchor in x)
+            else:
+                found = values.eq(anchor)
+            if found.any():
+                return found.to_numpy().argmax(), column
+        raise ValidationError(f"Cannot find {anchor} in file")
+
+    def locate_anchors(self, df):
+        # подпись кода может содержать что-то еще в той же ячейке,
+        # заголовок таблицы совпадает целиком
+        return {
+            self.code_anchor: self.find_anchor(df, self.code_anchor, substring=True),
+            self.table_anchor: self.find_anchor(df, self.table_anchor, substring=False),
+        }
+
+    def parse(self, uploaded_file):
+        brand_id = self.brand_id(uploaded_file.name)
+        df = pd.read_excel(uploaded_file, parse_dates=True, dtype={},)
+        df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
+        positions = self.locate_anchors(df)
+        code_row, code_column = positions[self.code_anchor]
+        confirmation_code = df.iat[code_row, code_column + 1]
+        start_row, start_column = positions[self.table_anchor]
+        first_column = df.iloc[start_row:, start_column].isna().to_numpy()
+        end_row = start_row + \
+            first_column.argmax() if first_column.any() else len(df)
+        df = df.iloc[start_row: end_row].reset_index(drop=True)
+        df.columns = df.iloc[0]
+        df = df.drop(index=[0]).reset_index(drop=True).drop(
+            self.table_anchor, axis=1)
+        df.index = df.index + 1
+        df.rename(columns=self.columns, inplace=True)
+        df['product'] = self.codes.product(df['product'], brand_id)
+        if self.date_format and 'delivery_date' in df.columns.values:
+            text_dates = df['delivery_date'].map(
+                lambda x: isinstance(x, str) and x != "")
+            df.loc[text_dates, 'delivery_date'] = pd.to_datetime(
+                df.loc[text_dates, 'delivery_date'],
+                format=self.date_format, errors='coerce')
+        df.loc['total', 'total_price'] = df['total_price'].sum()
+        df = df.fillna('').replace('unknown', "").infer_objects(copy=False)
+        return confirmation_code, df
+
+
+class InvoiceParser(ConfirmationParser):
+    """
+    Разбор счета: номер счета справа от code_anchor, таблица - как в
+    подтверждении; клиент берется из столбца, переименованного в client.
+    """
+
+    def parse(self, uploaded_file):
+        invoice_number, df = super().parse(uploaded_file)
+        if 'client' in df.columns.values:
+            df['client'] = self.codes.client(df['client'].astype(str))
+        return invoice_number, df
+
+
+class PriceListParser:
+    """
+    Разбор прайс-листа поставщика кусками по EXCEL_CHUNK_SIZE строк: код
+    товара приводится к id так же, как в Product.code_to_id, бренд - из
+    столбца brand (id или название) или общий для файла.
+    """
+
+    def __init__(self, supplier_id, columns):
+        self.supplier_id = supplier_id
+        self.columns = columns
+        self.strip_pattern = re.compile(
+            f"[{re.escape(Product.CODE_STRIP_CHARS)}]")
+
+    def product_ids(self, codes, brands):
+        ids = codes.str.replace(self.strip_pattern, "", regex=True).str.upper()
+        ascii_codes = ids.map(lambda code: isinstance(code, str) and code.isascii())
+        return (ids + "_" + brands).where(ascii_codes)
+
+    def brand_map(self):
+        # бренд в файле может быть указан и id, и названием
+        brands = {}
+        for brand_id, name in Brand.objects.values_list('id', 'name'):
+            brands[name.strip().upper()] = brand_id
+            brands[brand_id.upper()] = brand_id
+        return brands
+
+    def prepare(self, df, brand_id, brands):
+        df = df.rename(columns=self.columns)
+        if missing := {"product", "price"} - set(df.columns.values):
+            raise ValidationError(
+                f"Cannot find columns for {', '.join(sorted(missing))} in file")
+        df["name"] = df["product"].str.strip()
+        if "brand" in df.columns.values:
+            df["brand"] = df["brand"].str.strip().str.upper().map(brands)
+        elif brand_id:
+            df["brand"] = brand_id
+        else:
+            raise ValidationError("Choose brand: there is no brand column in file")
+        df["product"] = self.product_ids(df["name"], df["brand"])
+        df["price"] = pd.to_numeric(
+            df["price"].str.replace(",", ".", regex=False), errors="coerce")
+        if "description" not in df.columns.values:
+            df["description"] = None
+        df = df[["product", "name", "description", "brand", "price"]]
+        # строки без кода, бренда или цены пропускаются
+        df = df.dropna(subset=["product", "brand", "price"])
+        return df.astype(object).where(df.notna(), None)
+
+    def parse(self, uploaded_file, brand_id=None):
+        brands = self.brand_map()
+        if uploaded_file.name.lower().endswith(".xlsx"):
+            chunks = read_excel_chunks(uploaded_file, settings.EXCEL_CHUNK_SIZE)
+        else:
+            # xls читается только целиком
+            chunks = [pd.read_excel(uploaded_file, dtype=str)]
+        for chunk in chunks:
+            yield self.prepare(chunk, brand_id, brands)
+
+
+ORDER_PARSERS = {parser.supplier_id: parser for parser in [
+    OrderParser(
+        "T00016",
+        codes=CodeRules(strip_chars=".", zfill={"B05": 14}),
+    ),
+]}
+
+CONFIRMATION_PARSERS = {parser.supplier_id: parser for parser in [
+    ConfirmationParser(
+        "T00016",
+        code_anchor='Ihre Bestellnummer:',
+        table_anchor='Pos',
+        columns={
+            'Teilenummer': 'product',
+            'Bezeichnung': 'product_name',
+            'Menge': 'quantity',
+            'Preise': 'price',
+            'Liefertermin': 'delivery_date',
+            'Betrag': 'total_price',
+        },
+        date_format="%d.%m.%Y",
+    ),
+]}
+
+INVOICE_PARSERS = {parser.supplier_id: parser for parser in [
+    InvoiceParser(
+        "T00016",
+        code_anchor='Rechnungsnummer:',
+        table_anchor='Pos',
+        columns={
+            'Teilenummer': 'product',
+            'Bezeichnung': 'product_name',
+            'Kommission': 'client',
+            'Menge': 'quantity',
+            'Preise': 'price',
+            'Betrag': 'total_price',
+        },
+    ),
+]}
+
+
+PRICELIST_PARSERS = {parser.supplier_id: parser for parser in [
+    PriceListParser(
+        "T00016",
+        columns={
+            'Teilenummer': 'product',
+            'Bezeichnung': 'description',
+            'Marke': 'brand',
+            'Preis': 'price',
+        },
+    ),
+]}
+
+
+def get_parser(parsers, supplier):
+    try:
+        return parsers[supplier.id]
+    except KeyError:
+        raise ValidationError(f"No file format for supplier {supplier}")
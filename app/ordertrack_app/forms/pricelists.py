@@ -0,0 +1,32 @@
+from django import forms
+
+from ..models import PriceList, Brand
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class PriceListModelForm(forms.ModelForm):
+    brand = forms.ModelChoiceField(
+        queryset=Brand.objects.all(), required=False,
+        label="Brand", help_text="If there is no brand column in the file",
+        widget=forms.Select(attrs={'class': 'form-control'}))
+
+    class Meta:
+        model = PriceList
+        fields = ['supplier', 'pricelist_date', 'starts_from', 'state', 'comment']
+        labels = {
+            'supplier': 'Supplier',
+            'pricelist_date': 'Date',
+            'starts_from': 'Starts from',
+            'state': 'State',
+            'comment': 'Comment',
+        }
+        widgets = {
+            'supplier': forms.Select(attrs={'class': 'form-control'}),
+            'pricelist_date': forms.DateInput(attrs={'class': 'form-control', 'placeholder': 'Input price list date'}),
+            'starts_from': forms.DateInput(attrs={'class': 'form-control', 'placeholder': 'Input start date'}),
+            'state': forms.Select(attrs={'class': 'form-control'}),
+            'comment': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Input comment'}),
+        }
@@ -0,0 +1,16 @@
+from django import forms
+
+from ..models import Supplier
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ReconciliationForm(forms.Form):
+    supplier = forms.ModelChoiceField(
+        queryset=Supplier.objects.all(),
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+    all_pairs = forms.BooleanField(
+        required=False, label="Show all pairs",
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
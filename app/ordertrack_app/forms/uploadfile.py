@@ -1,16 +1,23 @@
 from django import forms
-from django.core.exceptions import ValidationError
+from django.conf import settings
 
-import pandas as pd
+from datetime import datetime
+from pathlib import PurePath
+import re
+import zipfile
 
-from ..models import (
-    Brand,
-)
+from .parsers import (
+    ORDER_PARSERS, CONFIRMATION_PARSERS, INVOICE_PARSERS, PRICELIST_PARSERS, get_parser)
+from ..models import Order, Supplier
+from .. import parsecache
 
 import logging
 
 log = logging.getLogger(__name__)
 
+# увеличить при изменении разбора файлов, чтобы сбросить кэш
+PARSER_VERSION = 2
+
 
 class UploadFileForm(forms.Form):
     file = forms.FileField(label="", required=False, widget=forms.ClearableFileInput(attrs={
@@ -26,90 +33,105 @@ class UploadFileForm(forms.Form):
 class UploadOrderForm(UploadFileForm):
 
     @staticmethod
-    def __load_excel_order_T00016(uploaded_file):
-        brand = uploaded_file.name.split(
-            "-")[2].replace(".", "").replace(" ", "").upper()
-        client = uploaded_file.name.split(
-            "-")[1].replace(".", "").replace(" ", "").upper()
-        df = pd.read_excel(uploaded_file, parse_dates=True, dtype=str,)
-        df.columns = df.columns.str.lower()
-        df.dropna(inplace=True)
-        if "note" not in df.columns.values:
-            df["client"] = client
-        else:
-            df["client"] = df["note"].apply(
-                lambda x: f'{x.replace(".", "").upper()}')
-        df.rename(columns={df.columns.values[0]: 'product'}, inplace=True)
-        df['product'] = df['product'].astype(
-            str).str.replace(".", "") + f"_{brand}"
-        if df.columns.get_loc('quantity') == 2:
-            df.rename(
-                columns={df.columns.values[1]: 'second_id'}, inplace=True)
-            df["second_id"] = df["second_id"].astype(
-                str).str.replace(".", "") + f"_{brand}"
-        else:
-            df["second_id"] = df["product"]
-        df['quantity'] = pd.to_numeric(df['quantity'])
-        if brand == "B05":
-            df['product'] = df['product'].str.zfill(14)
-        df = df.groupby(["product", "second_id", "client", ])[
-            "quantity"].sum()
-        df.loc['total'] = df.sum()
-        df = df.reset_index()
-        df.columns = ['product', "second_id", 'client', 'quantity',]
-        return df
-
-    @staticmethod
-    def load_excel_order(uploaded_file, supplier):
-        if supplier.id == "T00016":
-            order_data = UploadOrderForm.__load_excel_order_T00016(
-                uploaded_file)
-        return order_data
+    @parsecache.cached("order", PARSER_VERSION)
+    def load_excel_order(uploaded_file, supplier, streaming=None):
+        parser = get_parser(ORDER_PARSERS, supplier)
+        if streaming is None:
+            streaming = uploaded_file.name.lower().endswith(".xlsx") and \
+                uploaded_file.size >= settings.ORDER_STREAMING_MIN_SIZE
+        return parser.parse(uploaded_file, streaming=streaming)
 
 
 class UploadConfirmationForm(UploadFileForm):
 
-    def __find_next_value(df, target_value):
-        for column in df.columns.values:
-            if df[column].str.contains(target_value).any():
-                idx = df[column].str.contains(target_value).idxmax()
-                next_col = df.columns[df.columns.get_loc(column) + 1]
-                return df.loc[idx, next_col]
+    @staticmethod
+    @parsecache.cached("confirmation", PARSER_VERSION)
+    def load_excel_confirmation(uploaded_file, supplier):
+        parser = get_parser(CONFIRMATION_PARSERS, supplier)
+        return parser.parse(uploaded_file)
+
+
+class UploadInvoiceForm(UploadFileForm):
 
     @staticmethod
-    def __load_excel_confirmation_T00016(uploaded_file):
-        brand = uploaded_file.name.split(" ")[1]
-        brand_id = Brand.objects.filter(
-            name__icontains=brand).first().id
-        if brand_id is None:
-            raise ValidationError(f"Brand {brand_id} must be in Brands")
-        df = pd.read_excel(uploaded_file, parse_dates=True, dtype={},)
-        df = df.map(lambda x: x.strip() if isinstance(x, str) else x)
-        confirmation_code = UploadConfirmationForm.__find_next_value(
-            df, 'Ihre Bestellnummer:')
-        start_str = 'Pos'
-        start_index = df.loc[df['Unnamed: 0'] == start_str].index[0]
-        end_index = df['Unnamed: 0'].iloc[start_index:].isna().idxmax()
-        df = df.iloc[start_index: end_index].reset_index(
-            drop=True)
-        df.columns = df.iloc[0]
-        df = df.drop(index=[0]).reset_index(drop=True).drop('Pos', axis=1)
-        df.index = df.index + 1
-        df['Teilenummer'] = df['Teilenummer'].astype(
-            str).str.replace(".", "") + f"_{brand_id}"
-        df.rename(columns={'Teilenummer': 'product'}, inplace=True)
-        df.rename(columns={'Bezeichnung': 'product_name'}, inplace=True)
-        df.rename(columns={'Menge': 'quantity'}, inplace=True)
-        df.rename(columns={'Preise': 'price'}, inplace=True)
-        df.rename(columns={'Liefertermin': 'delivery_date'}, inplace=True)
-        df.rename(columns={'Betrag': 'total_price'}, inplace=True)
-        df.loc['total', 'total_price'] = df['total_price'].sum()
-        df = df.fillna('').replace('unknown', "").infer_objects(copy=False)
-        return confirmation_code, df
+    @parsecache.cached("invoice", PARSER_VERSION)
+    def load_excel_invoice(uploaded_file, supplier):
+        parser = get_parser(INVOICE_PARSERS, supplier)
+        return parser.parse(uploaded_file)
+
+
+class UploadPriceListForm(UploadFileForm):
 
     @staticmethod
-    def load_excel_confirmation(uploaded_file, supplier):
-        if supplier.id == "T00016":
-            confirmation_code, confirmation_data = UploadConfirmationForm.__load_excel_confirmation_T00016(
-                uploaded_file)
-        return confirmation_code, confirmation_data
+    def load_excel_pricelist(uploaded_file, supplier, brand=None):
+        # куски DataFrame, файл целиком в памяти не держится, поэтому без кэша
+        parser = get_parser(PRICELIST_PARSERS, supplier)
+        return parser.parse(uploaded_file, brand_id=brand.pk if brand else None)
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)]
+
+
+class UploadOrderBatchForm(forms.Form):
+    EXCEL_EXTENSIONS = (".xls", ".xlsx")
+    DATE_PATTERN = re.compile(r"(\d{2})-(\d{2})-(\d{4})")
+
+    files = MultipleFileField(label="Files", widget=MultipleFileInput(attrs={
+        'accept': '.xls,.xlsx,.zip',
+    }))
+    supplier = forms.ModelChoiceField(
+        queryset=Supplier.objects.all(), required=False,
+        label="Supplier", help_text="If it is not in the file name",
+        widget=forms.Select(attrs={'class': 'form-control'}))
+    order_date = forms.DateField(
+        required=False, label="Date", help_text="If it is not in the file name",
+        widget=forms.DateInput(attrs={'class': 'form-control'}))
+
+    @classmethod
+    def expand_files(cls, uploaded_files):
+        # zip-архивы раскрываются, в работу идут только файлы excel
+        result = []
+        for uploaded_file in uploaded_files:
+            # xlsx сам по себе zip, поэтому смотрим на расширение
+            if uploaded_file.name.lower().endswith(".zip"):
+                with zipfile.ZipFile(uploaded_file) as archive:
+                    for member in archive.infolist():
+                        name = PurePath(member.filename).name
+                        if not member.is_dir() and name.lower().endswith(cls.EXCEL_EXTENSIONS):
+                            result.append((name, archive.read(member)))
+            else:
+                uploaded_file.seek(0)
+                result.append((uploaded_file.name, uploaded_file.read()))
+        return result
+
+    @classmethod
+    def file_order_fields(cls, filename):
+        # те же правила, что и при заполнении формы заказа по имени файла
+        stem = ".".join(filename.split(".")[:-1])
+        parts = stem.upper().replace(".", "").split("-")
+        order_date = None
+        if match := cls.DATE_PATTERN.search(stem):
+            day, month, year = match.groups()
+            try:
+                order_date = datetime(int(year), int(month), int(day)).date()
+            except ValueError:
+                pass
+        return {
+            "id": Order.name_into_id(filename),
+            "name": filename,
+            "order_date": order_date,
+            "supplier_id": parts[3].replace(" ", "") if len(parts) > 3 else None,
+        }
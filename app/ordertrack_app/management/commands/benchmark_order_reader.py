@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.core.files import File
+from django.conf import settings
+from ordertrack_app.models import Supplier
+from ordertrack_app.forms.uploadfile import UploadOrderForm
+
+from pathlib import Path
+import multiprocessing
+import resource
+import time
+
+
+def read_order(path, supplier_id, streaming):
+    # запускается в отдельном процессе, чтобы пиковая память считалась отдельно
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        order_data = UploadOrderForm.load_excel_order.__wrapped__(
+            File(f, name=Path(path).name), Supplier(id=supplier_id),
+            streaming=streaming)
+    return {
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "start_rss_mb": start_rss / 1024,
+        "lines": len(order_data) - 1,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare time and peak RSS of the full and streaming order readers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Order file named like the uploads')
+        parser.add_argument('--supplier', default='T00016')
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.EXCEL_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        settings.EXCEL_CHUNK_SIZE = options['chunk_size']
+        context = multiprocessing.get_context('fork')
+        for streaming in (False, True):
+            with context.Pool(1) as pool:
+                result = pool.apply(
+                    read_order, (options['file'], options['supplier'], streaming))
+            mode = 'streaming' if streaming else 'full'
+            self.stdout.write(
+                f"{mode:>9}: {result['lines']} lines, {result['seconds']:.2f} s, "
+                f"peak RSS {result['peak_rss_mb']:.1f} MB "
+                f"(+{result['peak_rss_mb'] - result['start_rss_mb']:.1f} MB)")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ordertrack_app.models import FulfilmentLedger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the fulfilment ledger from orders, confirmations, invoices and cancellations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare the ledger with a full recomputation')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = FulfilmentLedger.find_mismatches()
+            for (order_id, client_id, product_id), rows in sorted(mismatches.items()):
+                self.stdout.write(
+                    f"{order_id} / {client_id} / {product_id}: "
+                    f"expected {rows['expected']}, actual {rows['actual']}")
+            if mismatches:
+                raise CommandError(
+                    f"Ledger has {len(mismatches)} mismatched lines")
+            self.stdout.write(self.style.SUCCESS("Ledger is consistent"))
+            return
+        with transaction.atomic():
+            lines = FulfilmentLedger.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Ledger is rebuilt: {lines} lines"))
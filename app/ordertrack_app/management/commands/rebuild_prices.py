@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ordertrack_app.models import CurrentPrice
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the current price table from valid price lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare the table with a full recomputation')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = CurrentPrice.find_mismatches()
+            for (product_id, supplier_id), rows in sorted(mismatches.items()):
+                self.stdout.write(
+                    f"{product_id} / {supplier_id}: "
+                    f"expected {rows['expected']}, actual {rows['actual']}")
+            if mismatches:
+                raise CommandError(
+                    f"Current prices have {len(mismatches)} mismatched rows")
+            self.stdout.write(self.style.SUCCESS("Current prices are consistent"))
+            return
+        with transaction.atomic():
+            rows = CurrentPrice.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Current prices are rebuilt: {rows} rows"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ordertrack_app.models import Order, Confirmation
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored quantity, amount and line count totals of orders and confirmations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare stored totals with a recomputation')
+
+    def handle(self, *args, **options):
+        models = [Order, Confirmation]
+        if options['check']:
+            mismatches = 0
+            for model in models:
+                for row in model.find_totals_mismatches():
+                    mismatches += 1
+                    self.stdout.write(f"{model.__name__} {row['pk']}: " + ", ".join(
+                        f"{field} {row[field]} != {row[f'expected_{field}']}"
+                        for field in model.TOTALS))
+            if mismatches:
+                raise CommandError(f"{mismatches} documents have wrong totals")
+            self.stdout.write(self.style.SUCCESS("Totals are consistent"))
+            return
+        with transaction.atomic():
+            for model in models:
+                documents = model.refresh_totals()
+                self.stdout.write(self.style.SUCCESS(
+                    f"{model.__name__} totals are recomputed: {documents} documents"))
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:33
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('Order', 'Order'), ('Confirmation', 'Confirmation')], max_length=50)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Running', 'Running'), ('Success', 'Success'), ('Failure', 'Failure')], default='Pending', max_length=50)),
+                ('file', models.FileField(upload_to='imports/%Y/%m/%d')),
+                ('filename', models.CharField(max_length=450)),
+                ('form_data', models.JSONField(default=dict)),
+                ('object_id', models.CharField(blank=True, default=None, max_length=450, null=True)),
+                ('rows_parsed', models.PositiveIntegerField(default=0)),
+                ('rows_written', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
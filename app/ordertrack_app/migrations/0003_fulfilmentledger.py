@@ -0,0 +1,113 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from collections import defaultdict
+
+
+QUANTITY_FIELDS = ["ordered", "confirmed", "invoiced", "cancelled", "open"]
+
+
+def allocate(order_items, confirmation_items, confirmation_orders, invoiced, cancelled):
+    """
+    Строки журнала из выборок документов: order_items - (заказ, клиент, товар,
+    количество, дата) по дате заказа, confirmation_items - (id, подтверждение,
+    клиент, товар, количество) по дате подтверждения, confirmation_orders -
+    {подтверждение: заказы}, invoiced и cancelled - {строка подтверждения: количество}.
+    Копия ordertrack_app.models.ledger.allocate на момент миграции.
+    """
+    rows = {}
+    lines = defaultdict(list)
+    for order_id, client_id, product_id, quantity, _ in order_items:
+        rows[(order_id, client_id, product_id)] = dict.fromkeys(
+            QUANTITY_FIELDS, 0) | {"ordered": quantity}
+        lines[(client_id, product_id)].append(
+            (order_id, client_id, product_id))
+    for item_id, confirmation_id, client_id, product_id, quantity in confirmation_items:
+        targets = [line for line in lines.get((client_id, product_id), [])
+                   if line[0] in confirmation_orders[confirmation_id]]
+        if not targets:
+            continue
+        # сначала заполняем незакрытые строки, остаток - на последний заказ
+        chunks = []
+        remaining = quantity
+        for line in targets:
+            row = rows[line]
+            if take := min(remaining, max(row["ordered"] - row["confirmed"], 0)):
+                row["confirmed"] += take
+                chunks.append((line, take))
+                remaining -= take
+        if remaining or not chunks:
+            rows[targets[-1]]["confirmed"] += remaining
+            chunks.append((targets[-1], remaining))
+        for field, total in (("invoiced", invoiced.get(item_id, 0)),
+                             ("cancelled", cancelled.get(item_id, 0))):
+            for line, take in chunks:
+                part = min(total, take)
+                rows[line][field] += part
+                total -= part
+            rows[chunks[-1][0]][field] += total
+    for row in rows.values():
+        row["open"] = row["ordered"] - row["confirmed"]
+    return rows
+
+
+def fill_ledger(apps, schema_editor):
+    # журнал по существующим документам, как в FulfilmentLedger.rebuild
+    def get(model_name):
+        return apps.get_model("ordertrack_app", model_name)
+
+    order_items = get("OrderItem").objects.values_list(
+        'order_id', 'client_id', 'product_id', 'quantity', 'order__order_date'
+    ).order_by('order__order_date', 'order_id')
+    confirmation_items = list(get("ConfirmationItem").objects.values_list(
+        'id', 'confirmation_id', 'client_id', 'product_id', 'quantity'
+    ).order_by('confirmation__confirmation_date', 'confirmation_id', 'id'))
+    confirmation_orders = defaultdict(set)
+    for confirmation_id, order_id in get("Confirmation").order.through.objects.values_list(
+            'confirmation_id', 'order_id'):
+        confirmation_orders[confirmation_id].add(order_id)
+    invoiced = dict(get("InvoiceItem").objects.filter(
+        confirmationitem__isnull=False
+    ).values('confirmationitem_id').annotate(
+        total=models.Sum('quantity')).values_list('confirmationitem_id', 'total').order_by())
+    cancelled = dict(get("CancellationItem").objects.values(
+        'cancellation_item_id').annotate(
+        total=models.Sum('quantity')).values_list('cancellation_item_id', 'total').order_by())
+    rows = allocate(order_items, confirmation_items,
+                    confirmation_orders, invoiced, cancelled)
+    ledger = get("FulfilmentLedger")
+    ledger.objects.bulk_create([
+        ledger(order_id=order_id, client_id=client_id, product_id=product_id, **row)
+        for (order_id, client_id, product_id), row in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FulfilmentLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordered', models.PositiveIntegerField(default=0)),
+                ('confirmed', models.PositiveIntegerField(default=0)),
+                ('invoiced', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('open', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='ordertrack_app.client')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='ordertrack_app.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='ordertrack_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client', 'product'], name='ordertrack__client__37dc27_idx')],
+                'unique_together': {('order', 'client', 'product')},
+            },
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
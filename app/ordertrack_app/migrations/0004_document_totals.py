@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:57
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    # итоги существующих документов, как в TotalsDocument.refresh_totals
+    for model_name, fk, totals in (
+        ("Order", "order", {
+            "quantity_total": models.Sum("quantity"),
+            "lines_count": models.Count("id"),
+        }),
+        ("Confirmation", "confirmation", {
+            "quantity_total": models.Sum("quantity"),
+            "amount_total": models.Sum(
+                models.F("quantity") * models.F("price"),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+            "lines_count": models.Count("id"),
+        }),
+    ):
+        model = apps.get_model("ordertrack_app", model_name)
+        items = apps.get_model("ordertrack_app", f"{model_name}Item")
+        lines = items.objects.filter(
+            **{fk: models.OuterRef("pk")}).order_by().values(fk)
+        model.objects.update(**{
+            field: Coalesce(
+                models.Subquery(lines.annotate(total=aggregate).values("total")),
+                models.Value(0), output_field=model._meta.get_field(field))
+            for field, aggregate in totals.items()
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0003_fulfilmentledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='confirmation',
+            name='amount_total',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='confirmation',
+            name='lines_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='confirmation',
+            name='quantity_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='lines_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='quantity_total',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
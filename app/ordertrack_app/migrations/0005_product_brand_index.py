@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0004_document_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand', 'id'], name='ordertrack__brand_i_5f041e_idx'),
+        ),
+    ]
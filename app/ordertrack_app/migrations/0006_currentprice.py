@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_prices(apps, schema_editor):
+    # текущие цены существующих прайс-листов, как в CurrentPrice.compute
+    details = apps.get_model("ordertrack_app", "ProductDetail")
+    current_price = apps.get_model("ordertrack_app", "CurrentPrice")
+    rows = {}
+    for product_id, supplier_id, pricelist_id, price, starts_from in details.objects.filter(
+            pricelist__state="Valid"
+    ).order_by(
+        'pricelist__starts_from', 'pricelist__pricelist_date', 'pricelist_id', 'pk'
+    ).values_list('product_id', 'pricelist__supplier_id', 'pricelist_id',
+                  'price', 'pricelist__starts_from').iterator():
+        rows[(product_id, supplier_id)] = current_price(
+            product_id=product_id, supplier_id=supplier_id,
+            pricelist_id=pricelist_id, price=price, starts_from=starts_from)
+    current_price.objects.bulk_create(rows.values(), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0005_product_brand_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('starts_from', models.DateField()),
+                ('pricelist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_prices', to='ordertrack_app.pricelist')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_prices', to='ordertrack_app.product')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='current_prices', to='ordertrack_app.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['supplier', 'product'], name='ordertrack__supplie_64691a_idx')],
+                'unique_together': {('product', 'supplier')},
+            },
+        ),
+        migrations.RunPython(fill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0006_currentprice'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='kind',
+            field=models.CharField(choices=[('Order', 'Order'), ('Confirmation', 'Confirmation'), ('PriceList', 'Pricelist')], max_length=50),
+        ),
+    ]
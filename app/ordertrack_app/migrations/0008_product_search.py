@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# таблица FTS5 и триггеры SQLite, их имена используются в ordertrack_app.search
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE ordertrack_app_product_search USING fts5(
+        id, second_id, name, tokenize='trigram')""",
+    """INSERT INTO ordertrack_app_product_search (id, second_id, name)
+        SELECT id, coalesce(second_id, ''), coalesce(name, '') FROM ordertrack_app_product""",
+    """CREATE TRIGGER ordertrack_app_product_search_insert
+        AFTER INSERT ON ordertrack_app_product BEGIN
+        INSERT INTO ordertrack_app_product_search (id, second_id, name)
+            VALUES (new.id, coalesce(new.second_id, ''), coalesce(new.name, ''));
+        END""",
+    """CREATE TRIGGER ordertrack_app_product_search_delete
+        AFTER DELETE ON ordertrack_app_product BEGIN
+        DELETE FROM ordertrack_app_product_search
+            WHERE ordertrack_app_product_search MATCH
+                'id : "' || replace(old.id, '"', '""') || '"'
+            AND id = old.id;
+        END""",
+    """CREATE TRIGGER ordertrack_app_product_search_update
+        AFTER UPDATE OF id, second_id, name ON ordertrack_app_product BEGIN
+        DELETE FROM ordertrack_app_product_search
+            WHERE ordertrack_app_product_search MATCH
+                'id : "' || replace(old.id, '"', '""') || '"'
+            AND id = old.id;
+        INSERT INTO ordertrack_app_product_search (id, second_id, name)
+            VALUES (new.id, coalesce(new.second_id, ''), coalesce(new.name, ''));
+        END""",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS ordertrack_app_product_search_update",
+    "DROP TRIGGER IF EXISTS ordertrack_app_product_search_delete",
+    "DROP TRIGGER IF EXISTS ordertrack_app_product_search_insert",
+    "DROP TABLE IF EXISTS ordertrack_app_product_search",
+]
+
+# триграммные GIN-индексы обслуживают icontains (ILIKE '%...%')
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    *(f"""CREATE INDEX IF NOT EXISTS ordertrack_app_product_{column}_trgm
+        ON ordertrack_app_product USING gin ({column} gin_trgm_ops)"""
+      for column in ("id", "second_id", "name")),
+]
+
+POSTGRESQL_REVERSE = [
+    f"DROP INDEX IF EXISTS ordertrack_app_product_{column}_trgm"
+    for column in ("id", "second_id", "name")
+]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0007_importjob_pricelist'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_vendor_sql({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRESQL_FORWARD}),
+            run_vendor_sql({"sqlite": SQLITE_REVERSE, "postgresql": POSTGRESQL_REVERSE}),
+        ),
+    ]
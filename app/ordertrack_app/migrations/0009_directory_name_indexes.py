@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0008_product_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:30
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordertrack_app', '0010_dataversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='client',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='supplier',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='client_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='supplier_name_lower_idx'),
+        ),
+    ]
@@ -6,6 +6,9 @@ from .directories import (
     ProductDetail,
     PriceList,
 )
+# журнал импортируется раньше документов: модули документов ссылаются
+# на него как на ledger.FulfilmentLedger, сам он импортирует документы
+from .ledger import FulfilmentLedger
 from .orders import Order, OrderItem
 from .confirmations import (
     Confirmation,
@@ -15,4 +18,8 @@ from .confirmations import (
 from .invoices import (
     Invoice,
     InvoiceItem,
+    Cancellation,
+    CancellationItem,
 )
+from .prices import CurrentPrice
+from .imports import ImportJob
@@ -1,19 +1,24 @@
-from django.db import models
-from django.db.models.signals import pre_save
+from django.db import models, transaction
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.functions import Coalesce
 from django.dispatch import receiver
-from django.db.models import Sum
 
 from itertools import groupby
+from collections import defaultdict
 from datetime import datetime
+import pandas as pd
 
-from .orders import Supplier, Client, Product, OrderItem
+from .orders import Supplier, Client, Product, OrderItem, TotalsDocument
+from . import ledger
 
 import logging
 
 log = logging.getLogger(__name__)
 
 
-class Confirmation(models.Model):
+class Confirmation(TotalsDocument):
     id = models.CharField(primary_key=True, null=False, max_length=100)
     name = models.CharField(max_length=250)
     confirmation_code = models.CharField(max_length=10, unique=True)
@@ -25,9 +30,25 @@ class Confirmation(models.Model):
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
 
+    quantity_total = models.PositiveIntegerField(default=0)
+    amount_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, db_index=True)
+    lines_count = models.PositiveIntegerField(default=0)
+
+    TOTALS = {
+        "quantity_total": models.Sum("quantity"),
+        "amount_total": models.Sum(
+            models.F("quantity") * models.F("price"),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+        "lines_count": models.Count("id"),
+    }
+
     @property
     def total_amount(self):
-        return sum(item.total_amount for item in self.items.all())
+        # пересчет по строкам; в списках и карточке - сохраненный amount_total
+        return self.items.aggregate(total=Coalesce(
+            self.TOTALS["amount_total"], models.Value(0),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2)))["total"]
 
     class Meta:
         ordering = ['-confirmation_date']
@@ -61,42 +82,32 @@ class ConfirmationItem(models.Model):
         return 0
 
     @staticmethod
-    def get_left_quantity_per_client(confirmation, product):
-        # получаем товары из отмеченных в подтверждении заказов
-        orders_ids = confirmation.order.all().values_list(
-            'id', flat=True)
-        ordered_items = OrderItem.objects.filter(
-            order__id__in=orders_ids).select_related('order')
-
-        # Находим confirmation_item, где confirmation.order содержит любой из этих заказов
-        confirmed_items = ConfirmationItem.objects.filter(
-            confirmation__order__id__in=orders_ids
-        )
-        # Ищем количество товара в разрезе клиентов: заказанное количество минус подтвержденное
-        ordered_quantity_per_client = ordered_items.filter(
-            product=product).values('client_id').annotate(
-            quantity=Sum('quantity')
-        ).order_by('client_id')
-        confirmed_quantity_per_client = confirmed_items.filter(
-            product=product).values('client_id').annotate(
-            quantity=Sum('quantity')
-        ).order_by('client_id')
-        ordered_quantity = ordered_quantity_per_client.aggregate(
-            total=Sum("quantity", default=0))['total']
-        confirmed_quantity = confirmed_quantity_per_client.aggregate(
-            total=Sum("quantity", default=0))['total']
-        # список вида: [{client_id:value, quantity: value}]
-        left_quantity_per_client = []
-        if ordered_quantity-confirmed_quantity > 0:
-            for item in ordered_quantity_per_client:
-                total = sum(item['quantity'] for item in confirmed_quantity_per_client
-                            if item.get('client_id') == item["client_id"])
-                left_quantity_per_client.append(
-                    {"client_id": item["client_id"], "quantity": item["quantity"]-total})
-        return left_quantity_per_client
+    def get_left_quantity_per_product(confirmation, products=None, exclude_own=False):
+        # открытое количество по заказам подтверждения из журнала исполнения,
+        # exclude_own - без строк самого подтверждения (при перераспределении)
+        left_quantity = ledger.FulfilmentLedger.open_quantity(
+            confirmation.order.all(), products)
+        if exclude_own:
+            own_items = ConfirmationItem.objects.filter(confirmation=confirmation)
+            parts = [own_items] if products is None else [
+                own_items.filter(product__in=chunk) for chunk in ledger.chunks(products)]
+            for part in parts:
+                for product_id, client_id, quantity in part.values_list(
+                        'product_id', 'client_id', 'quantity'):
+                    # собственные строки распределены только по заказам подтверждения
+                    if (product_id, client_id) in left_quantity:
+                        left_quantity[(product_id, client_id)] += quantity
+        # словарь вида: {product_id: [{client_id:value, quantity: value}]}
+        left_quantity_per_product = defaultdict(list)
+        for (product_id, client_id), quantity in sorted(left_quantity.items()):
+            if quantity > 0:
+                left_quantity_per_product[product_id].append(
+                    {"client_id": client_id, "quantity": quantity})
+        return dict(left_quantity_per_product)
 
     @classmethod
-    def save_confirmation_items(cls, confirmation_data_json, confirmation):
+    def save_confirmation_items(cls, confirmation_data_json, confirmation, batch_size=None):
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
         # группируем товары в подтверждении
         filtered_data = [
             item for item in confirmation_data_json if item['product'] != ""]
@@ -104,44 +115,213 @@ class ConfirmationItem(models.Model):
         sorted_data = sorted(filtered_data,
                              key=lambda x: x['product'])
         grouped = groupby(sorted_data, key=lambda x: x['product'])
+        left_quantity_per_product = cls.get_left_quantity_per_product(
+            confirmation, {item['product'] for item in filtered_data})
 
+        products = []
+        confirmation_items = []
         for product_id, group in grouped:
             items = list(group)
             total_quantity = sum([item['quantity'] for item in items])
-
-            # Обновляем имя по продукту
-            product_id = items[0].get("product")
-            brand_id = product_id.split("_")[1]
-            product_name = items[0].get("product_name")
-            defaults = {
-                'name': product_name,
-                'brand_id': brand_id
-
-            }
-            product, created = Product.objects.update_or_create(
-                id=product_id, defaults=defaults)
             price = items[0].get("price")
-            # если такой продукт есть в заказе, т.е. известен клиент
-            left_quantity_per_client = cls.get_left_quantity_per_client(confirmation,
-                                                                        product)
-            if left_quantity_per_client:
-                for item in left_quantity_per_client:
-                    client_id = item['client_id']
-                    quantity = item['quantity']
-                    cls.objects.create(
-                        confirmation_id=confirmation.id,
-                        client_id=client_id,
-                        product_id=product.id,
-                        quantity=quantity,
+            products.append(Product(
+                id=product_id,
+                name=items[0].get("product_name"),
+                brand_id=product_id.split("_")[1]))
+            confirmation_items.extend(cls.allocate_product(
+                confirmation, product_id, total_quantity, price,
+                left_quantity_per_product.get(product_id)))
+
+        # Обновляем имена товаров одним запросом
+        Product.objects.bulk_create(
+            products,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['name', 'brand'])
+        if any(item.client_id == "Unknown" for item in confirmation_items):
+            Client.objects.get_or_create(id="Unknown")
+        confirmation_items = cls.objects.bulk_create(
+            confirmation_items, batch_size=batch_size)
+        ledger.FulfilmentLedger.refresh(
+            (item.client_id, item.product_id) for item in confirmation_items)
+        Confirmation.refresh_totals([confirmation.id])
+        return confirmation_items
+
+    @classmethod
+    def allocate_product(cls, confirmation, product_id, total_quantity, price, left_quantity_per_client):
+        # если такой продукт есть в заказе, т.е. известен клиент
+        if left_quantity_per_client:
+            return [cls(confirmation_id=confirmation.id,
+                        client_id=item['client_id'],
+                        product_id=product_id,
+                        quantity=item['quantity'],
                         price=price)
-            else:
-                client, _ = Client.objects.get_or_create(id="Unknown")
-                cls.objects.create(
-                    confirmation_id=confirmation.id,
-                    client_id=client.id,
+                    for item in left_quantity_per_client]
+        return [cls(confirmation_id=confirmation.id,
+                    client_id="Unknown",
                     product_id=product_id,
                     quantity=total_quantity,
-                    price=price,)
+                    price=price)]
+
+    @classmethod
+    def reallocate_confirmation_items(cls, confirmation, changed_orders, batch_size=None):
+        # перераспределение по клиентам только товаров из добавленных
+        # или удаленных заказов, остальные строки не меняются
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        affected_products = set(OrderItem.objects.filter(
+            order__in=changed_orders,
+            product__in=cls.objects.filter(
+                confirmation=confirmation).values('product'),
+        ).values_list('product_id', flat=True))
+        summary = {"products": len(affected_products),
+                   "added": 0, "updated": 0, "deleted": 0}
+        if not affected_products:
+            return summary
+        existing = {
+            (item.client_id, item.product_id): item
+            for item in cls.objects.filter(
+                confirmation=confirmation, product__in=affected_products)
+        }
+        left_quantity_per_product = cls.get_left_quantity_per_product(
+            confirmation, affected_products, exclude_own=True)
+        allocated = {}
+        for product_id in sorted(affected_products):
+            product_items = [item for (_, item_product_id), item in existing.items()
+                             if item_product_id == product_id]
+            for item in cls.allocate_product(
+                    confirmation, product_id,
+                    sum(item.quantity for item in product_items),
+                    product_items[0].price,
+                    left_quantity_per_product.get(product_id)):
+                allocated[(item.client_id, item.product_id)] = item
+
+        new_items = [item for key, item in allocated.items()
+                     if key not in existing]
+        changed_items = []
+        for key, item in existing.items():
+            if key in allocated and item.quantity != allocated[key].quantity:
+                item.quantity = allocated[key].quantity
+                changed_items.append(item)
+        deleted_ids = [item.id for key, item in existing.items()
+                       if key not in allocated]
+        if any(item.client_id == "Unknown" for item in new_items):
+            Client.objects.get_or_create(id="Unknown")
+        with ledger.FulfilmentLedger.deferred() as ledger_keys:
+            if deleted_ids:
+                cls.objects.filter(id__in=deleted_ids).delete()
+            if new_items:
+                cls.objects.bulk_create(new_items, batch_size=batch_size)
+            if changed_items:
+                cls.objects.bulk_update(
+                    changed_items, ["quantity"], batch_size=batch_size)
+            ledger_keys.update(
+                (item.client_id, item.product_id) for item in new_items + changed_items)
+            Confirmation.refresh_totals([confirmation.id])
+        summary.update(added=len(new_items), updated=len(
+            changed_items), deleted=len(deleted_ids))
+        return summary
+
+    @classmethod
+    def apply_line_operations(cls, confirmation, operations, batch_size=None):
+        # частичное изменение строк: проверяются только затронутые товары -
+        # количество по товару не меняется, пара (клиент, товар) уникальна
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        if not isinstance(operations, list) or not operations:
+            raise ValidationError("No operations")
+        try:
+            ids = {int(operation["id"]) for operation in operations}
+        except (TypeError, KeyError, ValueError):
+            raise ValidationError("Each operation must have a line id")
+        products = set(cls.objects.filter(
+            confirmation=confirmation, id__in=ids).values_list('product_id', flat=True))
+        lines = {item.id: item for item in cls.objects.filter(
+            confirmation=confirmation, product__in=products)}
+        if missing := ids - lines.keys():
+            raise ValidationError(
+                f"Lines {sorted(missing)} are not in confirmation {confirmation.pk}")
+        initial_quantity = defaultdict(int)
+        for item in lines.values():
+            initial_quantity[item.product_id] += item.quantity
+        initial_keys = {item.id: (item.client_id, item.product_id, item.quantity)
+                        for item in lines.values()}
+
+        new_items, deleted = [], set()
+        for operation in operations:
+            item = lines[int(operation["id"])]
+            op = operation.get("op")
+            if item.id in deleted:
+                raise ValidationError(f"Line {item.id} is deleted")
+            try:
+                if op == "quantity":
+                    item.quantity = int(operation["quantity"])
+                elif op == "reassign":
+                    item.client_id = str(operation["client"])
+                elif op == "split":
+                    quantity = int(operation["quantity"])
+                    item.quantity -= quantity
+                    new_items.append(cls(
+                        confirmation_id=confirmation.id,
+                        client_id=str(operation["client"]),
+                        product_id=item.product_id,
+                        quantity=quantity,
+                        price=item.price))
+                elif op == "delete":
+                    deleted.add(item.id)
+                else:
+                    raise ValidationError(f"Unknown operation {op}")
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError(f"Wrong operation {operation}")
+
+        result = [item for item in lines.values() if item.id not in deleted] + new_items
+        errors = []
+        if not_positive := sorted({item.product_id for item in result if item.quantity <= 0}):
+            errors.append(f"Quantity must be positive: {', '.join(not_positive)}")
+        final_quantity = defaultdict(int)
+        for item in result:
+            final_quantity[item.product_id] += item.quantity
+        errors.extend(
+            f"Must be {quantity} of {product_id}"
+            for product_id, quantity in sorted(initial_quantity.items())
+            if final_quantity[product_id] != quantity)
+        client_product = [(item.client_id, item.product_id) for item in result]
+        if len(client_product) != len(set(client_product)):
+            errors.append("Product-Client must be distinct.")
+        clients = {item.client_id for item in result}
+        if unknown := clients - set(Client.objects.filter(
+                id__in=clients).values_list('id', flat=True)):
+            errors.append(f"Unknown clients: {', '.join(sorted(unknown))}")
+        if errors:
+            raise ValidationError(errors)
+
+        changed_items = [item for item in lines.values()
+                         if item.id not in deleted and
+                         initial_keys[item.id] != (item.client_id, item.product_id, item.quantity)]
+        with transaction.atomic(), ledger.FulfilmentLedger.deferred() as ledger_keys:
+            # сначала удаление и обновление, чтобы освободить пары (клиент, товар)
+            if deleted:
+                cls.objects.filter(id__in=deleted).delete()
+            # уникальность проверяется построчно: при обмене клиентами строки
+            # сначала получают временный клиент (внешний ключ проверяется при фиксации)
+            if reassigned := [cls(id=item.id, client_id=f"~{item.id}") for item in changed_items
+                              if initial_keys[item.id][0] != item.client_id]:
+                cls.objects.bulk_update(reassigned, ["client"], batch_size=batch_size)
+            if changed_items:
+                cls.objects.bulk_update(
+                    changed_items, ["client", "quantity"], batch_size=batch_size)
+            if new_items:
+                cls.objects.bulk_create(new_items, batch_size=batch_size)
+            ledger_keys.update((client_id, product_id)
+                               for client_id, product_id, _ in initial_keys.values())
+            ledger_keys.update(client_product)
+            Confirmation.refresh_totals([confirmation.id])
+        return sorted(result, key=lambda item: item.id or 0)
+
+
+@receiver(post_save, sender=ConfirmationItem)
+@receiver(post_delete, sender=ConfirmationItem)
+def refresh_confirmation_totals(sender, instance, **kwargs):
+    Confirmation.refresh_totals([instance.confirmation_id])
 
 
 class ConfirmationDelivery(models.Model):
@@ -156,25 +336,33 @@ class ConfirmationDelivery(models.Model):
         unique_together = ("confirmation", "product", "delivery_date")
 
     @classmethod
-    def save_confirmation_delivery(cls, confirmation_data_json, confirmation):
-        filtered_data = [
-            item for item in confirmation_data_json if item['product'] != "" and
-            item['delivery_date'] != "" and item['delivery_date'] != "None"]
-        sorted_data = sorted(filtered_data,
-                             key=lambda x: (x['product'], x['delivery_date']))
-        grouped = groupby(
-            sorted_data,
-            key=lambda x: (x['product'], x['delivery_date']))
-        for (product, delivery), group in grouped:
-            items = list(group)
-            product, delivery = (product, delivery)
-            try:
-                delivery_date = datetime.fromtimestamp(
-                    delivery / 1000).strftime('%Y-%m-%d')
-            except Exception as e:
-                log.info(e)
-            except all():
-                delivery_date = None
-            quantity = sum([item['quantity'] for item in items])
-            cls.objects.create(
-                confirmation_id=confirmation.id, product_id=product, delivery_date=delivery_date, quantity=quantity)
+    def save_confirmation_delivery(cls, confirmation_data_json, confirmation, batch_size=None):
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        df = pd.DataFrame(confirmation_data_json,
+                          columns=['product', 'quantity', 'delivery_date'])
+        df = df[(df['product'] != "") &
+                ~df['delivery_date'].isin(["", "None"])]
+        if df.empty:
+            return []
+        # даты приходят как Timestamp из DataFrame или в миллисекундах из JSON,
+        # переводим весь столбец сразу
+        timestamps = pd.to_numeric(df['delivery_date'], errors='coerce')
+        delivery_dates = pd.to_datetime(
+            timestamps, unit='ms', errors='coerce'
+        ).fillna(pd.to_datetime(
+            df['delivery_date'].mask(timestamps.notna()), errors='coerce'
+        )).dt.normalize()
+        if not_parsed := delivery_dates.isna().sum():
+            log.info('%s delivery dates cannot be parsed', not_parsed)
+        df = df.assign(delivery_date=delivery_dates,
+                       quantity=pd.to_numeric(df['quantity']))
+        grouped = df.groupby(['product', 'delivery_date'], dropna=False)[
+            'quantity'].sum().reset_index()
+        return cls.objects.bulk_create([
+            cls(confirmation_id=confirmation.id,
+                product_id=row.product,
+                delivery_date=None if pd.isna(
+                    row.delivery_date) else row.delivery_date.date(),
+                quantity=row.quantity)
+            for row in grouped.itertuples(index=False)
+        ], batch_size=batch_size)
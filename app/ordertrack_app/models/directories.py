@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, connection
+from django.db.models.functions import Lower
+from django.conf import settings
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 
 from datetime import date
+import csv
+import io
 
 
 class Client(models.Model):
@@ -11,6 +15,10 @@ class Client(models.Model):
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
 
+    class Meta:
+        # поиск по началу названия без учета регистра (search.name_prefix)
+        indexes = [models.Index(Lower("name"), name="client_name_lower_idx")]
+
     def __str__(self):
         return self.name
 
@@ -22,6 +30,9 @@ class Supplier (models.Model):
         max_length=450, null=True, blank=True, default=None)
     brand = models.ManyToManyField("Brand", related_name="suppliers")
 
+    class Meta:
+        indexes = [models.Index(Lower("name"), name="supplier_name_lower_idx")]
+
     def __str__(self):
         return f'{self.id} - {self.name}'
 
@@ -51,6 +62,25 @@ class Product(models.Model):
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
 
+    # символы, которые убираются из кода товара при построении id
+    CODE_STRIP_CHARS = ".- "
+
+    class Meta:
+        # порядок и ключ постраничного списка товаров
+        indexes = [models.Index(fields=["brand", "id"])]
+
+    @classmethod
+    def normalise_code(cls, code):
+        return code.translate(str.maketrans("", "", cls.CODE_STRIP_CHARS)).upper()
+
+    @classmethod
+    def code_to_id(cls, code, brand_id):
+        # None, если в коде есть не-ascii символы
+        code = cls.normalise_code(code)
+        if code.isascii():
+            return code+"_"+brand_id
+        return None
+
     def __str__(self):
         return self.id
 
@@ -58,10 +88,7 @@ class Product(models.Model):
 @receiver(pre_save, sender=Product)
 def set_id(sender, instance, **kwargs):
     if not instance.id:
-        code = instance.name.replace(".", "").replace(
-            "-", "").replace(" ", "").upper()
-        if code.isascii():
-            instance.id = code+"_"+instance.brand.id
+        instance.id = instance.code_to_id(instance.name, instance.brand.id)
 
 
 class PriceList(models.Model):
@@ -90,3 +117,60 @@ class ProductDetail(models.Model):
 
     def __str__(self):
         return f"{self.price} - {self.pricelist.state}"
+
+    @classmethod
+    def load_pricelist(cls, pricelist, chunks, batch_size=None):
+        """
+        Загрузка строк прайс-листа кусками: chunks - DataFrame со столбцами
+        product, name, description, brand, price. Недостающие товары создаются
+        одним запросом на кусок, строки прайс-листа пишутся
+        через COPY на PostgreSQL и bulk_create на остальных базах.
+        """
+        from .prices import CurrentPrice
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        loaded = set()
+        rows = 0
+        for chunk in chunks:
+            rows += len(chunk)
+            # повтор товара в прайс-листе: остается первая строка
+            chunk = chunk.drop_duplicates("product")
+            chunk = chunk[~chunk["product"].isin(loaded)]
+            loaded.update(chunk["product"])
+            # создаются только новые товары, названия существующих не меняются
+            Product.objects.bulk_create([
+                Product(id=row.product, name=row.name,
+                        description=row.description, brand_id=row.brand)
+                for row in chunk.itertuples(index=False)
+            ], batch_size=batch_size, ignore_conflicts=True)
+            details = ((row.product, pricelist.pk, f"{row.price:.2f}")
+                       for row in chunk.itertuples(index=False))
+            if connection.vendor == "postgresql":
+                cls.copy_rows(["product", "pricelist", "price"], details)
+            else:
+                cls.objects.bulk_create([
+                    cls(product_id=product_id, pricelist_id=pricelist_id, price=price)
+                    for product_id, pricelist_id, price in details
+                ], batch_size=batch_size)
+        # bulk_create и COPY сигналов не посылают
+        CurrentPrice.refresh(
+            cls.objects.filter(pricelist=pricelist).values("product_id"),
+            [pricelist.supplier_id])
+        return {"rows": rows, "details": len(loaded)}
+
+    @classmethod
+    def copy_rows(cls, fields, rows):
+        # COPY ... FROM STDIN: psycopg 3 - cursor.copy(), psycopg2 - copy_expert()
+        quote = connection.ops.quote_name
+        sql = "COPY {} ({}) FROM STDIN".format(
+            quote(cls._meta.db_table),
+            ", ".join(quote(cls._meta.get_field(field).column) for field in fields))
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, "copy"):
+                with cursor.cursor.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cursor.cursor.copy_expert(f"{sql} WITH (FORMAT csv)", buffer)
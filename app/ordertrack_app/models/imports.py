@@ -0,0 +1,70 @@
+from django.db import models
+from django.urls import reverse
+
+import uuid
+
+
+class ImportJob(models.Model):
+    class Kind(models.TextChoices):
+        ORDER = "Order"
+        CONFIRMATION = "Confirmation"
+        PRICELIST = "PriceList"
+
+    class Status(models.TextChoices):
+        PENDING = "Pending"
+        RUNNING = "Running"
+        SUCCESS = "Success"
+        FAILURE = "Failure"
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=50, choices=Kind.choices)
+    status = models.CharField(
+        max_length=50, choices=Status.choices, default=Status.PENDING)
+    file = models.FileField(upload_to="imports/%Y/%m/%d")
+    filename = models.CharField(max_length=450)
+    form_data = models.JSONField(default=dict)
+    object_id = models.CharField(
+        max_length=450, null=True, blank=True, default=None)
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.SUCCESS, self.Status.FAILURE)
+
+    def get_object_url(self):
+        if self.status != self.Status.SUCCESS or not self.object_id:
+            return None
+        if self.kind == self.Kind.ORDER:
+            return reverse('vieworder', kwargs={'pk': self.object_id})
+        if self.kind == self.Kind.PRICELIST:
+            return reverse('admin:ordertrack_app_pricelist_change', args=[self.object_id])
+        return reverse('viewconfirmation', kwargs={'pk': self.object_id})
+
+    def as_dict(self):
+        return {
+            "id": str(self.id),
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "rows_parsed": self.rows_parsed,
+            "rows_written": self.rows_written,
+            "errors": self.errors,
+            "duration": self.duration,
+            "url": self.get_object_url(),
+        }
+
+    def __str__(self):
+        return f"{self.kind} - {self.filename}"
@@ -1,12 +1,18 @@
 from django.db import models
+from django.conf import settings
+from django.db.models.functions import Coalesce
 
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
 from .directories import Supplier
+from .orders import LedgerDocument
 from .confirmations import ConfirmationItem
+from . import ledger
 
 
-class Invoice(models.Model):
+class Invoice(LedgerDocument):
     name = models.CharField(max_length=250)
     invoice_date = models.DateField(default=datetime.today)
     supplier = models.ForeignKey(
@@ -26,8 +32,91 @@ class InvoiceItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @staticmethod
+    def open_confirmation_lines(supplier, products):
+        # строки подтверждений поставщика с остатком, не выставленным
+        # в счетах и не отмененным, в порядке даты подтверждения
+        def quantity_total(model, field):
+            return Coalesce(models.Subquery(model.objects.filter(
+                **{field: models.OuterRef("pk")}
+            ).order_by().values(field).annotate(
+                total=models.Sum("quantity")).values("total")), 0)
+        return ConfirmationItem.objects.filter(
+            confirmation__supplier=supplier, product__in=products
+        ).annotate(
+            open=models.F("quantity")
+            - quantity_total(InvoiceItem, "confirmationitem")
+            - quantity_total(CancellationItem, "cancellation_item")
+        ).filter(open__gt=0).order_by(
+            "confirmation__confirmation_date", "confirmation_id", "id"
+        ).values_list("id", "client_id", "product_id", "price", "open")
 
-class Cancellation(models.Model):
+    @classmethod
+    def match_invoice_lines(cls, supplier, invoice_data_json):
+        # хеш-соединение строк счета с открытыми строками подтверждений
+        # по (товар, клиент, цена); без клиента - по (товар, цена).
+        # Количество строки счета набирается из нескольких строк подтверждений;
+        # несопоставленный остаток не сохраняется, он показывается в отчете
+        lines = [item for item in invoice_data_json if item.get("product")]
+        by_client = defaultdict(list)
+        by_product = defaultdict(list)
+        for item_id, client_id, product_id, price, open_quantity in cls.open_confirmation_lines(
+                supplier, {item["product"] for item in lines}):
+            # остаток общий для обоих индексов
+            candidate = [item_id, open_quantity]
+            by_client[(product_id, client_id, price)].append(candidate)
+            by_product[(product_id, price)].append(candidate)
+
+        items, report = [], []
+        for number, line in enumerate(lines, 1):
+            client_id = line.get("client") or None
+            row = {"line": number, "product": line["product"], "client": client_id,
+                   "quantity": line.get("quantity"), "matched": 0,
+                   "status": "unmatched", "message": ""}
+            report.append(row)
+            try:
+                quantity = int(line["quantity"])
+                price = Decimal(str(line["price"])).quantize(Decimal("0.01"))
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                row["message"] = "Wrong quantity or price"
+                continue
+            if client_id:
+                candidates = by_client.get((line["product"], client_id, price), [])
+            else:
+                candidates = by_product.get((line["product"], price), [])
+            remaining = quantity
+            for candidate in candidates:
+                if not remaining:
+                    break
+                if take := min(remaining, candidate[1]):
+                    candidate[1] -= take
+                    remaining -= take
+                    items.append(cls(confirmationitem_id=candidate[0],
+                                     quantity=take, price=price))
+            row["matched"] = quantity - remaining
+            if remaining:
+                row["message"] = f"{remaining} not matched to confirmations, not saved"
+            if not remaining:
+                row["status"] = "matched"
+            elif remaining < quantity:
+                row["status"] = "partial"
+        return items, report
+
+    @classmethod
+    def save_invoice_items(cls, invoice_data_json, invoice, batch_size=None):
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        items, report = cls.match_invoice_lines(
+            invoice.supplier, invoice_data_json)
+        for item in items:
+            item.invoice = invoice
+        cls.objects.bulk_create(items, batch_size=batch_size)
+        ledger.FulfilmentLedger.refresh(ConfirmationItem.objects.filter(
+            pk__in={item.confirmationitem_id for item in items}
+        ).values_list('client_id', 'product_id'))
+        return report
+
+
+class Cancellation(LedgerDocument):
     cancellation_date = models.DateField(default=datetime.today)
     supplier = models.ForeignKey(
         Supplier, on_delete=models.CASCADE, related_name="cancellations")
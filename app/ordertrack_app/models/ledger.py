@@ -0,0 +1,324 @@
+from django.db import models, transaction
+from django.conf import settings
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .directories import Client, Product
+from .orders import Order, OrderItem, pending_totals
+from .confirmations import Confirmation, ConfirmationItem
+from .invoices import InvoiceItem, CancellationItem
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# ключи (клиент, товар), ожидающие пересчета внутри FulfilmentLedger.deferred()
+pending_keys = ContextVar("ledger_pending_keys", default=None)
+
+QUANTITY_FIELDS = ["ordered", "confirmed", "invoiced", "cancelled", "open"]
+
+VERSION_KEY = "ledger:version"
+
+
+def chunks(values, size=None):
+    # куски для списков __in: в SQLite число параметров запроса ограничено
+    values = list(values)
+    size = size or settings.LEDGER_CHUNK_SIZE
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def allocate(order_items, confirmation_items, confirmation_orders, invoiced, cancelled):
+    """
+    Строки журнала из выборок документов: order_items - (заказ, клиент, товар,
+    количество, дата) по дате заказа, confirmation_items - (id, подтверждение,
+    клиент, товар, количество) по дате подтверждения, confirmation_orders -
+    {подтверждение: заказы}, invoiced и cancelled - {строка подтверждения: количество}.
+    Пары (клиент, товар) распределяются независимо друг от друга.
+    """
+    rows = {}
+    lines = defaultdict(list)
+    for order_id, client_id, product_id, quantity, _ in order_items:
+        rows[(order_id, client_id, product_id)] = dict.fromkeys(
+            QUANTITY_FIELDS, 0) | {"ordered": quantity}
+        lines[(client_id, product_id)].append(
+            (order_id, client_id, product_id))
+    for item_id, confirmation_id, client_id, product_id, quantity in confirmation_items:
+        targets = [line for line in lines.get((client_id, product_id), [])
+                   if line[0] in confirmation_orders[confirmation_id]]
+        if not targets:
+            continue
+        # сначала заполняем незакрытые строки, остаток - на последний заказ
+        chunks = []
+        remaining = quantity
+        for line in targets:
+            row = rows[line]
+            if take := min(remaining, max(row["ordered"] - row["confirmed"], 0)):
+                row["confirmed"] += take
+                chunks.append((line, take))
+                remaining -= take
+        if remaining or not chunks:
+            rows[targets[-1]]["confirmed"] += remaining
+            chunks.append((targets[-1], remaining))
+        for field, total in (("invoiced", invoiced.get(item_id, 0)),
+                             ("cancelled", cancelled.get(item_id, 0))):
+            for line, take in chunks:
+                part = min(total, take)
+                rows[line][field] += part
+                total -= part
+            rows[chunks[-1][0]][field] += total
+    for row in rows.values():
+        row["open"] = row["ordered"] - row["confirmed"]
+    return rows
+
+
+class DataVersion(models.Model):
+    """
+    Именованный счетчик в базе, чтобы его видели все процессы (веб и celery):
+    версия данных для ключей кэша, статистика кэша разбора файлов.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def get(cls, name):
+        return cls.objects.filter(pk=name).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name, value=1):
+        if not cls.objects.filter(pk=name).update(version=models.F("version") + value):
+            cls.objects.bulk_create([cls(name=name, version=value)], ignore_conflicts=True)
+
+    @classmethod
+    def get_many(cls, names):
+        return dict.fromkeys(names, 0) | dict(
+            cls.objects.filter(pk__in=names).values_list("name", "version"))
+
+
+class FulfilmentLedger(models.Model):
+    """
+    Исполнение строки заказа: заказано, подтверждено, выставлено в счете,
+    отменено и открыто (заказано минус подтверждено).
+    Подтвержденное количество распределяется по заказам подтверждения
+    в порядке даты заказа, счета и отмены - следом за своей строкой подтверждения.
+    """
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="ledger")
+    client = models.ForeignKey(
+        Client, on_delete=models.CASCADE, related_name="ledger")
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="ledger")
+    ordered = models.PositiveIntegerField(default=0)
+    confirmed = models.PositiveIntegerField(default=0)
+    invoiced = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    open = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("order", "client", "product")
+        indexes = [models.Index(fields=["client", "product"])]
+
+    @staticmethod
+    def key_filter(clients=None, products=None, client_field="client", product_field="product"):
+        conditions = {}
+        if clients is not None:
+            conditions[f"{client_field}__in"] = clients
+        if products is not None:
+            conditions[f"{product_field}__in"] = products
+        return conditions
+
+    @classmethod
+    def compute(cls, clients=None, products=None, keys=None):
+        # строки журнала для пар (клиент, товар) из clients x products,
+        # keys - только эти пары из выборки
+        order_items = OrderItem.objects.filter(
+            **cls.key_filter(clients, products)
+        ).values_list('order_id', 'client_id', 'product_id', 'quantity',
+                      'order__order_date').order_by('order__order_date', 'order_id')
+        confirmation_items = list(ConfirmationItem.objects.filter(
+            **cls.key_filter(clients, products)
+        ).values_list('id', 'confirmation_id', 'client_id', 'product_id', 'quantity'
+                      ).order_by('confirmation__confirmation_date', 'confirmation_id', 'id'))
+        if keys is not None:
+            order_items = [item for item in order_items if item[1:3] in keys]
+            confirmation_items = [item for item in confirmation_items if item[2:4] in keys]
+        confirmation_orders = defaultdict(set)
+        for confirmation_id, order_id in Confirmation.order.through.objects.filter(
+                confirmation_id__in={item[1] for item in confirmation_items}
+        ).values_list('confirmation_id', 'order_id'):
+            confirmation_orders[confirmation_id].add(order_id)
+        item_filter = cls.key_filter(
+            clients, products, "confirmationitem__client", "confirmationitem__product")
+        invoiced = dict(InvoiceItem.objects.filter(
+            confirmationitem__isnull=False, **item_filter
+        ).values('confirmationitem_id').annotate(
+            total=models.Sum('quantity')).values_list('confirmationitem_id', 'total').order_by())
+        item_filter = cls.key_filter(
+            clients, products, "cancellation_item__client", "cancellation_item__product")
+        cancelled = dict(CancellationItem.objects.filter(
+            **item_filter
+        ).values('cancellation_item_id').annotate(
+            total=models.Sum('quantity')).values_list('cancellation_item_id', 'total').order_by())
+        return allocate(order_items, confirmation_items,
+                        confirmation_orders, invoiced, cancelled)
+
+    @classmethod
+    def refresh(cls, keys, batch_size=None):
+        keys = set(keys)
+        if not keys:
+            return
+        if (pending := pending_keys.get()) is not None:
+            pending.update(keys)
+            return
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        # ключи одного товара идут подряд: в куске мало товаров и клиентов
+        for chunk in chunks(sorted(keys, key=lambda key: (key[1], key[0]))):
+            cls.refresh_keys(set(chunk), batch_size)
+        cls.bump_version()
+
+    @classmethod
+    def refresh_keys(cls, keys, batch_size):
+        # пересчитываются только пары keys, записываются только изменившиеся строки
+        clients = {client_id for client_id, _ in keys}
+        products = {product_id for _, product_id in keys}
+        rows = cls.compute(clients, products, keys)
+        current = {}
+        for row in cls.objects.filter(**cls.key_filter(clients, products)).values(
+                'id', 'order_id', 'client_id', 'product_id', *QUANTITY_FIELDS):
+            key = (row.pop("order_id"), row.pop("client_id"), row.pop("product_id"))
+            if key[1:] in keys:
+                current[key] = row
+        for ids in chunks([row["id"] for key, row in current.items() if key not in rows]):
+            cls.objects.filter(id__in=ids).delete()
+        cls.objects.bulk_update([
+            cls(id=current[key]["id"], **row) for key, row in rows.items()
+            if key in current and any(current[key][field] != row[field] for field in QUANTITY_FIELDS)
+        ], QUANTITY_FIELDS, batch_size=batch_size)
+        cls.objects.bulk_create([
+            cls(order_id=order_id, client_id=client_id, product_id=product_id, **row)
+            for (order_id, client_id, product_id), row in rows.items()
+            if (order_id, client_id, product_id) not in current
+        ], batch_size=batch_size)
+
+    @staticmethod
+    def data_version():
+        # меняется при каждом пересчете журнала - ключ для кэшей отчетов
+        return DataVersion.get(VERSION_KEY)
+
+    @staticmethod
+    def bump_version():
+        # до фиксации читатель не должен сохранить в кэш старые данные под новой версией
+        transaction.on_commit(lambda: DataVersion.bump(VERSION_KEY))
+
+    @classmethod
+    def rebuild(cls, batch_size=None):
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        rows = cls.compute()
+        cls.objects.all().delete()
+        cls.objects.bulk_create([
+            cls(order_id=order_id, client_id=client_id, product_id=product_id, **row)
+            for (order_id, client_id, product_id), row in rows.items()
+        ], batch_size=batch_size)
+        cls.bump_version()
+        return len(rows)
+
+    @classmethod
+    def find_mismatches(cls):
+        # расхождения между таблицей и пересчетом с нуля
+        expected = cls.compute()
+        actual = {
+            (row.pop("order_id"), row.pop("client_id"), row.pop("product_id")): row
+            for row in cls.objects.values('order_id', 'client_id', 'product_id', *QUANTITY_FIELDS)
+        }
+        return {key: {"expected": expected.get(key), "actual": actual.get(key)}
+                for key in expected.keys() | actual.keys()
+                if expected.get(key) != actual.get(key)}
+
+    @classmethod
+    @contextmanager
+    def deferred(cls):
+        # сигналы внутри блока только собирают ключи и документы,
+        # пересчет журнала и итогов документов - один раз в конце
+        if pending_keys.get() is not None:
+            yield pending_keys.get()
+            return
+        pending = set()
+        documents = defaultdict(set)
+        token = pending_keys.set(pending)
+        totals_token = pending_totals.set(documents)
+        try:
+            yield pending
+        finally:
+            pending_keys.reset(token)
+            pending_totals.reset(totals_token)
+        cls.refresh(pending)
+        for model, ids in documents.items():
+            model.refresh_totals(ids)
+
+    @staticmethod
+    def open_quantity(orders, products=None):
+        # открытое количество по заказам: {(product_id, client_id): quantity}
+        ledger = FulfilmentLedger.objects.filter(order__in=orders)
+        parts = [ledger] if products is None else [
+            ledger.filter(product__in=chunk) for chunk in chunks(products)]
+        return {
+            (item['product_id'], item['client_id']): item['quantity']
+            for part in parts
+            for item in part.values('product_id', 'client_id').annotate(
+                quantity=models.Sum('open')).order_by()
+        }
+
+
+def item_keys(items):
+    return set(items.values_list('client_id', 'product_id'))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=ConfirmationItem)
+@receiver(post_delete, sender=ConfirmationItem)
+def refresh_item_ledger(sender, instance, **kwargs):
+    keys = {(instance.client_id, instance.product_id)}
+    # при изменении клиента или товара строки пересчитываем и старый ключ
+    if previous := getattr(instance, "_ledger_key", None):
+        keys.add(previous)
+    FulfilmentLedger.refresh(keys)
+
+
+@receiver(post_init, sender=OrderItem)
+@receiver(post_init, sender=ConfirmationItem)
+def remember_item_key(sender, instance, **kwargs):
+    if instance.pk:
+        instance._ledger_key = (instance.__dict__.get("client_id"),
+                                instance.__dict__.get("product_id"))
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+def refresh_invoice_ledger(sender, instance, **kwargs):
+    FulfilmentLedger.refresh(item_keys(ConfirmationItem.objects.filter(
+        pk=instance.confirmationitem_id)))
+
+
+@receiver(post_save, sender=CancellationItem)
+@receiver(post_delete, sender=CancellationItem)
+def refresh_cancellation_ledger(sender, instance, **kwargs):
+    FulfilmentLedger.refresh(item_keys(ConfirmationItem.objects.filter(
+        pk=instance.cancellation_item_id)))
+
+
+@receiver(m2m_changed, sender=Confirmation.order.through)
+def refresh_confirmation_orders_ledger(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        items = ConfirmationItem.objects.filter(confirmation=instance)
+    elif pk_set:
+        items = ConfirmationItem.objects.filter(confirmation__in=pk_set)
+    else:
+        items = OrderItem.objects.filter(order=instance)
+    FulfilmentLedger.refresh(item_keys(items))
@@ -1,11 +1,97 @@
 from django.db import models
-from django.db.models.signals import pre_save
+from django.conf import settings
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 
+from contextvars import ContextVar
+
 from .directories import Supplier, Client, Product
+from . import ledger
+
+# {модель документа: id}, итоги которых ожидают пересчета внутри FulfilmentLedger.deferred()
+pending_totals = ContextVar("pending_totals", default=None)
+
+
+class LedgerDocument(models.Model):
+    """Документ, строки которого учитываются в журнале исполнения заказов."""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # поля документа (поставщик, даты) входят в отчеты, но не в журнал
+        result = super().save(*args, **kwargs)
+        ledger.FulfilmentLedger.bump_version()
+        return result
+
+    def delete(self, *args, **kwargs):
+        # каскадное удаление строк пересчитывается в журнале один раз
+        with ledger.FulfilmentLedger.deferred():
+            result = super().delete(*args, **kwargs)
+        ledger.FulfilmentLedger.bump_version()
+        return result
+
+
+class TotalsDocument(LedgerDocument):
+    """
+    Документ с итогами по строкам, сохраненными в его полях.
+    TOTALS - поле итога и агрегат по строкам документа (related_name="items").
+    """
+    TOTALS = {}
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # итоги меняет только refresh_totals, сохранение формы их не перезаписывает
+        if not self._state.adding and not kwargs.get("force_insert") \
+                and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTALS]
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def totals_expressions(cls):
+        items = cls._meta.get_field("items")
+        lines = items.related_model.objects.filter(
+            **{items.field.name: models.OuterRef("pk")}
+        ).order_by().values(items.field.name)
+        return {
+            field: Coalesce(
+                models.Subquery(lines.annotate(
+                    total=aggregate).values("total")),
+                models.Value(0),
+                output_field=cls._meta.get_field(field))
+            for field, aggregate in cls.TOTALS.items()
+        }
+
+    @classmethod
+    def refresh_totals(cls, ids=None):
+        # пересчет итогов одним UPDATE, без ids - по всем документам
+        documents = cls.objects.all()
+        if ids is not None:
+            ids = set(ids)
+            if not ids:
+                return 0
+            if (pending := pending_totals.get()) is not None:
+                pending[cls].update(ids)
+                return 0
+            documents = documents.filter(pk__in=ids)
+        return documents.update(**cls.totals_expressions())
 
+    @classmethod
+    def find_totals_mismatches(cls):
+        # документы, у которых сохраненные итоги не совпадают с пересчетом
+        expected = {f"expected_{field}": expression
+                    for field, expression in cls.totals_expressions().items()}
+        return list(cls.objects.annotate(**expected).exclude(**{
+            field: models.F(f"expected_{field}") for field in cls.TOTALS
+        }).values("pk", *cls.TOTALS, *expected).order_by("pk"))
 
-class Order(models.Model):
+
+class Order(TotalsDocument):
     id = models.CharField(primary_key=True, null=False, max_length=450)
     name = models.CharField(null=False, blank=False, max_length=450)
     order_date = models.DateField()
@@ -13,10 +99,19 @@ class Order(models.Model):
         Supplier, on_delete=models.CASCADE, related_name="orders")
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
+    quantity_total = models.PositiveIntegerField(default=0, db_index=True)
+    lines_count = models.PositiveIntegerField(default=0)
+
+    TOTALS = {
+        "quantity_total": models.Sum("quantity"),
+        "lines_count": models.Count("id"),
+    }
 
     @property
     def total_quantity(self):
-        return sum(item.quantity for item in self.items.all())
+        # пересчет по строкам; в списках и карточке - сохраненный quantity_total
+        return self.items.aggregate(
+            total=Coalesce(models.Sum("quantity"), 0))["total"]
 
     class Meta:
         ordering = ['-order_date']
@@ -52,17 +147,97 @@ class OrderItem(models.Model):
         unique_together = ("order", "client", "product")
 
     @classmethod
-    def save_order_items(cls, order_data_json, order):
-        for item in order_data_json:
+    def save_order_items(cls, order_data_json, order, batch_size=None):
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        items = [
+            item for item in order_data_json if item.get("product") != "total"]
+        cls.save_products(items, batch_size)
+        order_items = cls.objects.bulk_create([
+            cls(order_id=order.id,
+                client_id=item.get("client"),
+                product_id=item.get("product"),
+                quantity=item.get("quantity"))
+            for item in items
+        ], batch_size=batch_size)
+        ledger.FulfilmentLedger.refresh(
+            (item.client_id, item.product_id) for item in order_items)
+        Order.refresh_totals([order.id])
+        return order_items
+
+    @staticmethod
+    def save_products(items, batch_size):
+        # все товары создаем одним запросом, существующие пропускаем
+        products = {}
+        for item in items:
             product_id = item.get("product")
-            if product_id != "total":
-                second_id = item.get("second_id")
-                if product_id == second_id:
-                    second_id = None
-                brand_id = product_id.split("_")[1]
-                client_id = item.get("client")
-                quantity = item.get("quantity")
-                product, created = Product.objects.get_or_create(
-                    id=product_id, second_id=second_id, brand_id=brand_id)
-                cls.objects.create(
-                    order_id=order.id, client_id=client_id, product_id=product_id, quantity=quantity)
+            second_id = item.get("second_id")
+            if product_id == second_id:
+                second_id = None
+            products.setdefault(product_id, Product(
+                id=product_id,
+                second_id=second_id,
+                brand_id=product_id.split("_")[1]))
+        if products:
+            Product.objects.bulk_create(
+                products.values(), batch_size=batch_size, ignore_conflicts=True)
+
+    @classmethod
+    def apply_order_revision(cls, order_data_json, order, batch_size=None):
+        # сравнение нового файла с текущими строками заказа по (клиент, товар),
+        # записываются только отличия
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        revision = {}
+        for item in order_data_json:
+            if item.get("product") == "total":
+                continue
+            key = (item.get("client"), item.get("product"))
+            if key in revision:
+                revision[key]["quantity"] += item.get("quantity")
+            else:
+                revision[key] = dict(item)
+        existing = {
+            (item.client_id, item.product_id): item
+            for item in cls.objects.filter(order=order).only(
+                "id", "client_id", "product_id", "quantity")
+        }
+        new_items = [item for key, item in revision.items()
+                     if key not in existing]
+        changed_items = []
+        for key, item in existing.items():
+            if key in revision and item.quantity != revision[key]["quantity"]:
+                item.quantity = revision[key]["quantity"]
+                changed_items.append(item)
+        deleted_ids = [item.id for key, item in existing.items()
+                       if key not in revision]
+        cls.save_products(new_items, batch_size)
+        with ledger.FulfilmentLedger.deferred() as ledger_keys:
+            if new_items:
+                cls.objects.bulk_create([
+                    cls(order_id=order.id,
+                        client_id=item.get("client"),
+                        product_id=item.get("product"),
+                        quantity=item.get("quantity"))
+                    for item in new_items
+                ], batch_size=batch_size)
+            if changed_items:
+                cls.objects.bulk_update(
+                    changed_items, ["quantity"], batch_size=batch_size)
+            if deleted_ids:
+                cls.objects.filter(id__in=deleted_ids).delete()
+            ledger_keys.update(
+                (item.get("client"), item.get("product")) for item in new_items)
+            ledger_keys.update(
+                (item.client_id, item.product_id) for item in changed_items)
+            Order.refresh_totals([order.id])
+        return {
+            "added": len(new_items),
+            "updated": len(changed_items),
+            "deleted": len(deleted_ids),
+            "unchanged": len(existing) - len(changed_items) - len(deleted_ids),
+        }
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_order_totals(sender, instance, **kwargs):
+    Order.refresh_totals([instance.order_id])
@@ -0,0 +1,143 @@
+from django.db import models
+from django.conf import settings
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .directories import Supplier, Product, PriceList, ProductDetail
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class CurrentPrice(models.Model):
+    """
+    Текущая цена товара у поставщика: цена из действующего прайс-листа
+    с самой поздней датой начала действия.
+    """
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="current_prices")
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.CASCADE, related_name="current_prices")
+    pricelist = models.ForeignKey(
+        PriceList, on_delete=models.CASCADE, related_name="current_prices")
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    starts_from = models.DateField()
+
+    class Meta:
+        unique_together = ("product", "supplier")
+        indexes = [models.Index(fields=["supplier", "product"])]
+
+    @staticmethod
+    def compute(products=None, suppliers=None):
+        # {(товар, поставщик): строка}, позже начавшийся прайс-лист перекрывает ранний
+        details = ProductDetail.objects.filter(
+            pricelist__state=PriceList.State.VALID)
+        if products is not None:
+            details = details.filter(product__in=products)
+        if suppliers is not None:
+            details = details.filter(pricelist__supplier__in=suppliers)
+        rows = {}
+        for product_id, supplier_id, pricelist_id, price, starts_from in details.order_by(
+                'pricelist__starts_from', 'pricelist__pricelist_date', 'pricelist_id', 'pk'
+        ).values_list('product_id', 'pricelist__supplier_id', 'pricelist_id',
+                      'price', 'pricelist__starts_from').iterator(
+                          chunk_size=settings.BULK_BATCH_SIZE):
+            rows[(product_id, supplier_id)] = {
+                "pricelist_id": pricelist_id, "price": price, "starts_from": starts_from}
+        return rows
+
+    @classmethod
+    def refresh(cls, products=None, suppliers=None, batch_size=None):
+        # пересчет пар из products x suppliers, None - все;
+        # products может быть подзапросом values("product_id")
+        batch_size = batch_size or settings.BULK_BATCH_SIZE
+        if products is not None and not isinstance(products, models.QuerySet):
+            products = set(products)
+            if not products:
+                return 0
+        rows = cls.compute(products, suppliers)
+        current = cls.objects.all()
+        if products is not None:
+            current = current.filter(product__in=products)
+        if suppliers is not None:
+            current = current.filter(supplier__in=suppliers)
+        current.delete()
+        cls.objects.bulk_create([
+            cls(product_id=product_id, supplier_id=supplier_id, **row)
+            for (product_id, supplier_id), row in rows.items()
+        ], batch_size=batch_size)
+        return len(rows)
+
+    @classmethod
+    def rebuild(cls, batch_size=None):
+        return cls.refresh(batch_size=batch_size)
+
+    @classmethod
+    def find_mismatches(cls):
+        expected = cls.compute()
+        actual = {
+            (row.pop("product_id"), row.pop("supplier_id")): row
+            for row in cls.objects.values(
+                'product_id', 'supplier_id', 'pricelist_id', 'price', 'starts_from')
+        }
+        return {key: {"expected": expected.get(key), "actual": actual.get(key)}
+                for key in expected.keys() | actual.keys()
+                if expected.get(key) != actual.get(key)}
+
+    @staticmethod
+    def lookup(products, supplier):
+        # {товар: текущая цена поставщика} по индексу (supplier, product)
+        return dict(CurrentPrice.objects.filter(
+            supplier=supplier, product__in=products
+        ).values_list('product_id', 'price'))
+
+
+def cascaded(sender, origin):
+    # удаление пришло каскадом от другой модели: строки CurrentPrice
+    # удаляются тем же каскадом или пересчитываются ее обработчиком
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    return model is not sender
+
+
+@receiver(post_save, sender=ProductDetail)
+@receiver(post_delete, sender=ProductDetail)
+def refresh_detail_price(sender, instance, origin=None, **kwargs):
+    if cascaded(sender, origin):
+        return
+    products, pricelists = {instance.product_id}, {instance.pricelist_id}
+    # при замене товара или прайс-листа пересчитываем и прежнюю пару
+    if previous := getattr(instance, "_price_key", None):
+        products.add(previous[0])
+        pricelists.add(previous[1])
+    CurrentPrice.refresh(products, set(PriceList.objects.filter(
+        pk__in=pricelists).values_list('supplier_id', flat=True)))
+    instance._price_key = (instance.product_id, instance.pricelist_id)
+
+
+@receiver(post_init, sender=ProductDetail)
+def remember_detail_key(sender, instance, **kwargs):
+    if instance.pk:
+        instance._price_key = (instance.__dict__.get("product_id"),
+                               instance.__dict__.get("pricelist_id"))
+
+
+@receiver(post_save, sender=PriceList)
+@receiver(post_delete, sender=PriceList)
+def refresh_pricelist_prices(sender, instance, origin=None, **kwargs):
+    # смена состояния или даты начала меняет цены всех товаров прайс-листа
+    if cascaded(sender, origin):
+        return
+    products = getattr(instance, "_price_products", None)
+    if products is None:
+        products = ProductDetail.objects.filter(
+            pricelist=instance).values_list('product_id', flat=True)
+    CurrentPrice.refresh(products, [instance.supplier_id])
+
+
+@receiver(pre_delete, sender=PriceList)
+def remember_pricelist_products(sender, instance, **kwargs):
+    instance._price_products = set(ProductDetail.objects.filter(
+        pricelist=instance).values_list('product_id', flat=True))
@@ -0,0 +1,101 @@
+from django.conf import settings
+
+from functools import wraps
+from pathlib import Path
+import hashlib
+import pickle
+import time
+
+from .models.ledger import DataVersion
+
+import logging
+
+log = logging.getLogger(__name__)
+
+STATS_KEYS = ("hits", "misses", "saved_ms")
+
+
+def file_hash(uploaded_file):
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    uploaded_file.seek(0)
+    return sha256.hexdigest()
+
+
+def cache_key(kind, version, uploaded_file, supplier):
+    # имя файла тоже входит в ключ: из него берутся бренд и клиент
+    key = "|".join([kind, str(version), supplier.id,
+                    Path(uploaded_file.name).name, file_hash(uploaded_file)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def cache_path(key):
+    return Path(settings.PARSE_CACHE_ROOT) / f"{key}.pkl"
+
+
+def get(key):
+    path = cache_path(key)
+    try:
+        with open(path, "rb") as f:
+            elapsed, result = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None, None
+    # время доступа нужно для вытеснения давно не использованных файлов
+    path.touch()
+    return elapsed, result
+
+
+def put(key, result, elapsed):
+    path = cache_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump((elapsed, result), f)
+    tmp_path.replace(path)
+    evict()
+
+
+def evict(max_size=None):
+    max_size = settings.PARSE_CACHE_MAX_SIZE if max_size is None else max_size
+    files = [(path, path.stat())
+             for path in Path(settings.PARSE_CACHE_ROOT).glob("*.pkl")]
+    total_size = sum(stat.st_size for _, stat in files)
+    for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+        if total_size <= max_size:
+            break
+        path.unlink(missing_ok=True)
+        total_size -= stat.st_size
+
+
+def record(name, value=1):
+    # счетчики в базе: локальный кэш у каждого процесса свой
+    DataVersion.bump(f"parsecache:{name}", value)
+
+
+def stats():
+    counters = DataVersion.get_many([f"parsecache:{name}" for name in STATS_KEYS])
+    return {name: counters[f"parsecache:{name}"] for name in STATS_KEYS}
+
+
+def cached(kind, version):
+    def decorator(parse):
+        @wraps(parse)
+        def wrapper(uploaded_file, supplier, **kwargs):
+            key = cache_key(kind, version, uploaded_file, supplier)
+            elapsed, result = get(key)
+            if result is not None:
+                record("hits")
+                record("saved_ms", int(elapsed * 1000))
+                log.info('Parse cache hit for %s: %s', uploaded_file.name, stats())
+                return result
+            started = time.perf_counter()
+            result = parse(uploaded_file, supplier, **kwargs)
+            elapsed = time.perf_counter() - started
+            put(key, result, elapsed)
+            record("misses")
+            log.info('Parse cache miss for %s (%.3f s): %s',
+                     uploaded_file.name, elapsed, stats())
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.core.cache import cache
+
+import numpy as np
+import pandas as pd
+
+from .models import (
+    OrderItem,
+    ConfirmationItem,
+    InvoiceItem,
+    CancellationItem,
+    FulfilmentLedger,
+)
+
+import logging
+
+log = logging.getLogger(__name__)
+
+KEY = ["client", "product"]
+
+COLUMNS = [
+    "client", "product", "ordered", "confirmed", "invoiced", "cancelled",
+    "confirmed_amount", "invoiced_amount", "confirmed_price_min",
+    "confirmed_price_max", "invoice_price_mismatches", "flags",
+]
+
+# отметки расхождений по паре (клиент, товар)
+FLAGS = {
+    "over_confirmed": "confirmed more than ordered",
+    "not_confirmed": "ordered, but not confirmed",
+    "over_invoiced": "invoiced and cancelled more than confirmed",
+    "not_invoiced": "confirmed, but not invoiced or cancelled",
+    "confirmed_price": "different confirmed prices",
+    "invoice_price": "invoice price differs from confirmed",
+}
+
+
+def extract(queryset, fields, columns):
+    # одна выборка values_list на таблицу, сразу в DataFrame
+    return pd.DataFrame.from_records(
+        list(queryset.values_list(*fields).order_by().iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE)),
+        columns=columns)
+
+
+def extract_supplier(supplier_id):
+    ordered = extract(
+        OrderItem.objects.filter(order__supplier_id=supplier_id),
+        ["client_id", "product_id", "quantity"], KEY + ["quantity"])
+    confirmed = extract(
+        ConfirmationItem.objects.filter(confirmation__supplier_id=supplier_id),
+        ["client_id", "product_id", "quantity", "price"], KEY + ["quantity", "price"])
+    invoiced = extract(
+        InvoiceItem.objects.filter(invoice__supplier_id=supplier_id),
+        ["confirmationitem__client_id", "confirmationitem__product_id",
+         "quantity", "price", "confirmationitem__price"],
+        KEY + ["quantity", "price", "confirmed_price"])
+    cancelled = extract(
+        CancellationItem.objects.filter(cancellation__supplier_id=supplier_id),
+        ["cancellation_item__client_id", "cancellation_item__product_id", "quantity"],
+        KEY + ["quantity"])
+    return ordered, confirmed, invoiced, cancelled
+
+
+def build_report(ordered, confirmed, invoiced, cancelled):
+    for df in (confirmed, invoiced):
+        for column in ("price", "confirmed_price"):
+            if column in df.columns:
+                df[column] = df[column].astype(float)
+    # строки счета без строки подтверждения не относятся ни к одной паре
+    unmatched = invoiced[invoiced["client"].isna()]
+    invoiced = invoiced[invoiced["client"].notna()]
+
+    confirmed = confirmed.assign(amount=confirmed["quantity"] * confirmed["price"])
+    invoiced = invoiced.assign(
+        amount=invoiced["quantity"] * invoiced["price"],
+        price_mismatch=~np.isclose(invoiced["price"], invoiced["confirmed_price"]))
+    parts = [
+        ordered.groupby(KEY)["quantity"].sum().rename("ordered"),
+        confirmed.groupby(KEY).agg(
+            confirmed=("quantity", "sum"),
+            confirmed_amount=("amount", "sum"),
+            confirmed_price_min=("price", "min"),
+            confirmed_price_max=("price", "max")),
+        invoiced.groupby(KEY).agg(
+            invoiced=("quantity", "sum"),
+            invoiced_amount=("amount", "sum"),
+            invoice_price_mismatches=("price_mismatch", "sum")),
+        cancelled.groupby(KEY)["quantity"].sum().rename("cancelled"),
+    ]
+    report = pd.concat(parts, axis=1, join="outer")
+    quantities = ["ordered", "confirmed", "invoiced", "cancelled",
+                  "invoice_price_mismatches"]
+    amounts = ["confirmed_amount", "invoiced_amount"]
+    # пустые выборки дают столбцы object, приводим к числам до fillna
+    report[quantities] = report[quantities].astype(float).fillna(0).astype(int)
+    report[amounts] = report[amounts].astype(float).fillna(0).round(2)
+
+    closed = report["invoiced"] + report["cancelled"]
+    conditions = {
+        "over_confirmed": report["confirmed"] > report["ordered"],
+        "not_confirmed": (report["confirmed"] < report["ordered"]),
+        "over_invoiced": closed > report["confirmed"],
+        "not_invoiced": closed < report["confirmed"],
+        "confirmed_price": ~np.isclose(
+            report["confirmed_price_min"].fillna(0), report["confirmed_price_max"].fillna(0)),
+        "invoice_price": report["invoice_price_mismatches"] > 0,
+    }
+    flags = pd.Series("", index=report.index)
+    for name, condition in conditions.items():
+        flags = flags.where(~condition, flags + name + " ")
+    report["flags"] = flags.str.strip()
+    report = report.reset_index().sort_values(KEY)[COLUMNS].reset_index(drop=True)
+    summary = {
+        "pairs": len(report),
+        "mismatches": int((report["flags"] != "").sum()),
+        **{name: int(condition.sum()) for name, condition in conditions.items()},
+        "unmatched_invoiced": int(unmatched["quantity"].sum()),
+    }
+    return report, summary
+
+
+def supplier_report(supplier_id):
+    # кэш по поставщику сбрасывается при любом пересчете журнала исполнения
+    key = f"reconciliation:{supplier_id}:{FulfilmentLedger.data_version()}"
+    if (cached := cache.get(key)) is not None:
+        return cached
+    result = build_report(*extract_supplier(supplier_id))
+    cache.set(key, result, timeout=settings.RECONCILIATION_CACHE_TIMEOUT)
+    return result
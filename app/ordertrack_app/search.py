@@ -0,0 +1,91 @@
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+from django.db.models.expressions import RawSQL
+
+from .models import Product, Order, Client, Supplier
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# таблица FTS5 из миграции 0008_product_search, синхронизируется триггерами
+SEARCH_TABLE = "ordertrack_app_product_search"
+
+# триграммный индекс не ищет строки короче трех символов
+MIN_TRIGRAM_LENGTH = 3
+
+
+def quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_expression(query, code):
+    # код ищется в id и second_id, текст запроса как есть - во всех столбцах
+    parts = [quote(query)]
+    if len(code) >= MIN_TRIGRAM_LENGTH and code != query.upper():
+        parts.append(f"{{id second_id}} : {quote(code)}")
+    return " OR ".join(parts)
+
+
+def prefix(field, value):
+    # диапазон вместо LIKE: по нему работает обычный индекс
+    return Q(**{f"{field}__gte": value, f"{field}__lt": value + "\U0010ffff"})
+
+
+def product_matches(query):
+    """Условие поиска товара по id, second_id и названию."""
+    query = query.strip()
+    code = Product.normalise_code(query)
+    if len(query) < MIN_TRIGRAM_LENGTH:
+        return prefix("id", code) | prefix("second_id", code)
+    if connection.vendor == "sqlite":
+        return Q(pk__in=RawSQL(
+            f"SELECT id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            [match_expression(query, code)]))
+    # PostgreSQL: icontains обслуживают триграммные GIN-индексы
+    return Q(id__icontains=code) | Q(second_id__icontains=code) | Q(name__icontains=query)
+
+
+def search_products(query, queryset=None):
+    # точное совпадение нормализованного кода - первым
+    queryset = Product.objects.all() if queryset is None else queryset
+    code = Product.normalise_code(query.strip())
+    exact = Q(id=code) | Q(second_id=code) | \
+        Q(id__startswith=f"{code}_") | Q(second_id__startswith=f"{code}_")
+    return queryset.filter(product_matches(query)).annotate(
+        rank=Case(When(exact, then=Value(0)), default=Value(1),
+                   output_field=IntegerField())
+    ).order_by("rank", "id")
+
+
+def code_prefix(query):
+    code = Product.normalise_code(query)
+    return prefix("id", code) | prefix("second_id", code)
+
+
+def lower_prefix(field, value):
+    # тот же диапазон по lower(field): его обслуживает функциональный индекс
+    value = value.lower()
+    return Q(GreaterThanOrEqual(Lower(field), value), LessThan(Lower(field), value + "\U0010ffff"))
+
+
+def name_prefix(query):
+    # id хранится в верхнем регистре, название сравнивается без учета регистра
+    return prefix("id", query.upper()) | lower_prefix("name", query)
+
+
+# модель и условие по индексированным префиксам для autocomplete
+AUTOCOMPLETE = {
+    "order": (Order, lambda query: prefix("id", query)),
+    "product": (Product, code_prefix),
+    "client": (Client, name_prefix),
+    "supplier": (Supplier, name_prefix),
+}
+
+
+def autocomplete(model_name, query, limit):
+    model, condition = AUTOCOMPLETE[model_name]
+    return [{"id": str(obj.pk), "text": str(obj)}
+            for obj in model.objects.filter(condition(query.strip())).order_by("pk")[:limit]]
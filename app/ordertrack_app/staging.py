@@ -0,0 +1,55 @@
+from django.conf import settings
+
+import pandas as pd
+import re
+import secrets
+import time
+from pathlib import Path
+
+import logging
+
+log = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"^[\w-]{16,64}$")
+
+
+def staging_path(token):
+    if not token or not TOKEN_PATTERN.match(token):
+        return None
+    return Path(settings.STAGING_ROOT) / f"{token}.pkl"
+
+
+def stage(data):
+    # DataFrame сохраняется в бинарном виде с типами столбцов,
+    # в сессии хранится только токен
+    token = secrets.token_urlsafe(24)
+    path = staging_path(token)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data.to_pickle(path)
+    return token
+
+
+def load(token):
+    path = staging_path(token)
+    if path is None or not path.exists():
+        return None
+    return pd.read_pickle(path)
+
+
+def discard(token):
+    if path := staging_path(token):
+        path.unlink(missing_ok=True)
+
+
+def clean_expired(max_age=None):
+    max_age = settings.STAGING_MAX_AGE if max_age is None else max_age
+    staging_root = Path(settings.STAGING_ROOT)
+    if not staging_root.exists():
+        return 0
+    expired_before = time.time() - max_age
+    removed = 0
+    for path in staging_root.glob("*.pkl"):
+        if path.stat().st_mtime < expired_before:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
@@ -1,11 +1,21 @@
 from django.core import management
 from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
 from datetime import datetime
 
 from .apps import OrdertrackAppConfig
+from . import staging
+from .models import ImportJob, OrderItem, ConfirmationItem, ConfirmationDelivery, ProductDetail
+from .forms.orders import OrderModelForm
+from .forms.confirmations import ConfirmationModelForm
+from .forms.pricelists import PriceListModelForm
+from .forms.uploadfile import UploadOrderForm, UploadConfirmationForm, UploadPriceListForm
 
 
 log = get_task_logger(__name__)
@@ -39,3 +49,96 @@ def create_backup():
     }
     log.info(f"Got action: {result}")
     return result
+
+
+@shared_task
+def clean_staging():
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "action": "clean_staging",
+        "removed": staging.clean_expired(),
+    }
+    log.info(f"Got action: {result}")
+    return result
+
+
+def import_order(job, uploaded_file):
+    form = OrderModelForm(data=MultiValueDict(job.form_data))
+    if not form.is_valid():
+        raise ValueError(form.errors.as_text())
+    order_data = UploadOrderForm.load_excel_order(
+        uploaded_file, supplier=form.cleaned_data["supplier"])
+    order_data_json = order_data.to_dict('records')
+    job.rows_parsed = len(order_data_json) - 1
+    with transaction.atomic():
+        order = form.save()
+        order_items = OrderItem.save_order_items(
+            order_data_json=order_data_json, order=order)
+    job.rows_written = len(order_items)
+    return order.pk
+
+
+def import_confirmation(job, uploaded_file):
+    form_data = MultiValueDict(job.form_data)
+    supplier_form = ConfirmationModelForm(data=form_data)
+    supplier_form.is_valid()
+    if not (supplier := supplier_form.cleaned_data.get("supplier")):
+        raise ValueError(supplier_form.errors.as_text())
+    confirmation_code, confirmation_data = UploadConfirmationForm.load_excel_confirmation(
+        uploaded_file, supplier=supplier)
+    form_data.setlist('confirmation_code', [confirmation_code])
+    form = ConfirmationModelForm(data=form_data)
+    if not form.is_valid():
+        raise ValueError(form.errors.as_text())
+    confirmation_data_json = confirmation_data.to_dict('records')
+    job.rows_parsed = len(confirmation_data_json) - 1
+    with transaction.atomic():
+        confirmation = form.save()
+        confirmation_items = ConfirmationItem.save_confirmation_items(
+            confirmation_data_json=confirmation_data_json, confirmation=confirmation)
+        ConfirmationDelivery.save_confirmation_delivery(
+            confirmation_data_json=confirmation_data_json, confirmation=confirmation)
+    job.rows_written = len(confirmation_items)
+    return confirmation.pk
+
+
+def import_pricelist(job, uploaded_file):
+    form = PriceListModelForm(data=MultiValueDict(job.form_data))
+    if not form.is_valid():
+        raise ValueError(form.errors.as_text())
+    chunks = UploadPriceListForm.load_excel_pricelist(
+        uploaded_file, supplier=form.cleaned_data["supplier"],
+        brand=form.cleaned_data["brand"])
+    with transaction.atomic():
+        pricelist = form.save()
+        loaded = ProductDetail.load_pricelist(pricelist, chunks)
+    job.rows_parsed = loaded["rows"]
+    job.rows_written = loaded["details"]
+    return pricelist.pk
+
+
+@shared_task
+def process_import_job(job_id):
+    job = ImportJob.objects.get(pk=job_id)
+    job.status = ImportJob.Status.RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=["status", "started_at"])
+    try:
+        with job.file.open("rb") as f:
+            uploaded_file = File(f, name=job.filename)
+            if job.kind == ImportJob.Kind.ORDER:
+                job.object_id = import_order(job, uploaded_file)
+            elif job.kind == ImportJob.Kind.PRICELIST:
+                job.object_id = import_pricelist(job, uploaded_file)
+            else:
+                job.object_id = import_confirmation(job, uploaded_file)
+        job.status = ImportJob.Status.SUCCESS
+    except Exception as e:
+        log.info(f"Import {job_id} failed: {e}")
+        job.status = ImportJob.Status.FAILURE
+        job.errors = [str(e)]
+    job.finished_at = timezone.now()
+    job.save()
+    result = job.as_dict()
+    log.info(f"Got action: {result}")
+    return result
@@ -4,6 +4,9 @@ from datetime import datetime
 from io import BytesIO
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+
+from config.celery import app as celery_app
 
 from ..models import (
     Client,
@@ -206,3 +209,57 @@ def confirmation_excel(create_test_excel):
     excel_file = next(create_test_excel(
         data, filename="Confirmation B0 010125.xlsx"))
     return excel_file
+
+
+@pytest.fixture
+def invoice_excel(create_test_excel):
+    data = {
+        'Unnamed: 0': ['', '', 'Pos', '1', '2', '3', ''],
+        'Unnamed: 1': ['', '', 'Teilenummer', 'TESTPRODUCT0', 'TESTPRODUCT1', 'TESTPRODUCT1', ''],
+        'Unnamed: 2': ['', '', 'Kommission', 'c0', '', 'C1', ''],
+        'Unnamed: 3': ['', '', 'Menge', 15, 25, 5, 'Total'],
+        'Unnamed: 4': ['Rechnungsnummer:', '', 'Preise', 0.1, 30.1, 99, 0],
+        'Unnamed: 5': ['R100', '', 'Betrag', 1.5, 752.5, 495, ''],
+    }
+    excel_file = next(create_test_excel(
+        data, filename="Invoice B0 010125.xlsx"))
+    return excel_file
+
+
+@pytest.fixture
+def pricelist_excel(create_test_excel):
+    data = {
+        'Teilenummer': ['Test.product-0', 'new 1', 'TESTPRODUCT0', 'X2', 'X3'],
+        'Bezeichnung': ['First', 'Second', 'Duplicate', 'Unknown brand', 'No price'],
+        'Marke': ['B0', 'Test brand B1', 'b0', 'B9', 'B0'],
+        'Preis': ['1,5', 2.25, 3, 4, ''],
+    }
+    excel_file = next(create_test_excel(data, filename="Pricelist.xlsx"))
+    return excel_file
+
+
+@pytest.fixture(autouse=True)
+def staging_root(settings, tmp_path):
+    settings.STAGING_ROOT = tmp_path / "staging"
+    return settings.STAGING_ROOT
+
+
+@pytest.fixture(autouse=True)
+def parse_cache_root(settings, tmp_path):
+    settings.PARSE_CACHE_ROOT = tmp_path / "parsecache"
+    cache.clear()
+    return settings.PARSE_CACHE_ROOT
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    return settings.MEDIA_ROOT
+
+
+@pytest.fixture
+def celery_eager(settings, media_root):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+    yield
+    celery_app.conf.CELERY_TASK_ALWAYS_EAGER = False
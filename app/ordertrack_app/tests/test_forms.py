@@ -2,10 +2,19 @@ import pytest
 from json import loads
 from datetime import datetime
 
+import pandas as pd
+
 from ..forms.uploadfile import (
     UploadOrderForm,
     UploadConfirmationForm,
 )
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from ..forms.parsers import CONFIRMATION_PARSERS, get_parser
+from ..forms.confirmations import ViewConfirmationItemFormSet
+from ..models import Supplier
+from .. import parsecache
 
 
 @pytest.mark.django_db
@@ -41,3 +50,76 @@ def test_uploadconfirmationform(confirmation_excel, supplier):
     ]
     assert confirmation_data_json_expected == loads(confirmation_data_json)
     assert confirmation_code == "T3"
+
+
+@pytest.mark.django_db
+def test_parse_cache(order_excel, supplier, parse_cache_root, mocker):
+    read_excel = mocker.spy(pd, "read_excel")
+    order_data = UploadOrderForm.load_excel_order(
+        order_excel, supplier=supplier)
+    cached_order_data = UploadOrderForm.load_excel_order(
+        order_excel, supplier=supplier)
+    assert read_excel.call_count == 1
+    assert cached_order_data.equals(order_data)
+    # счетчики хранятся в базе, а не в кэше процесса
+    cache.clear()
+    assert parsecache.stats()["hits"] == 1
+    assert parsecache.stats()["misses"] == 1
+    assert len(list(parse_cache_root.iterdir())) == 1
+    parsecache.evict(max_size=0)
+    assert list(parse_cache_root.iterdir()) == []
+
+
+@pytest.mark.django_db
+def test_uploadorderform_streaming(create_test_excel, supplier, settings):
+    settings.EXCEL_CHUNK_SIZE = 2
+    data = {
+        'Product number': ['P.0', 'P1', 'P.0', 'P2', 12345, 'P1'],
+        'Second number': ['S.0', 'S1', 'S.0', 'S2', 12345, 'S1'],
+        'Quantity': [10, 20, 5, 1, 7, 3],
+        'Note': ['C.0', 'C1', 'C.0', None, 'c1', 'C1'],
+    }
+    order_excel = next(create_test_excel(
+        data, filename="Order 3-C0-B0-T00016-01-01-2025.xlsx"))
+    load_excel_order = UploadOrderForm.load_excel_order.__wrapped__
+    order_data = load_excel_order(order_excel, supplier, streaming=False)
+    order_excel.seek(0)
+    streamed_order_data = load_excel_order(
+        order_excel, supplier, streaming=True)
+    assert streamed_order_data.equals(order_data)
+    assert order_data.to_dict('records')[-1] == {
+        "product": "total", "second_id": "", "client": "", "quantity": 45}
+
+
+@pytest.mark.django_db
+def test_parser_registry(confirmation_excel, create_test_excel, supplier):
+    other_supplier = Supplier.objects.create(id="T00099", name="Other")
+    with pytest.raises(ValidationError):
+        get_parser(CONFIRMATION_PARSERS, other_supplier)
+    parser = get_parser(CONFIRMATION_PARSERS, supplier)
+    confirmation_code, _ = parser.parse(confirmation_excel)
+    assert confirmation_code == "T3"
+    # другая раскладка и подпись кода с дополнительным текстом в той же ячейке
+    moved_excel = next(create_test_excel({
+        'Unnamed: 0': ['', 'Pos', '1', ''],
+        'Unnamed: 1': ['Ref. / Ihre Bestellnummer: ', 'Teilenummer', 'TESTPRODUCT0', ''],
+        'Unnamed: 2': ['T4', 'Menge', 10, 'Total'],
+        'Unnamed: 3': ['', 'Preise', 10.1, 101],
+        'Unnamed: 4': ['', 'Betrag', 101, ''],
+    }, filename="Confirmation B0 020125.xlsx"))
+    confirmation_code, confirmation_data = parser.parse(moved_excel)
+    assert confirmation_code == "T4"
+    assert confirmation_data["product"].iloc[0] == "TESTPRODUCT0_B0"
+
+
+@pytest.mark.django_db
+def test_confirmation_formset_price_map(confirmations, confirmationitems, django_assert_num_queries):
+    confirmation = confirmations.get("0")
+    formset = ViewConfirmationItemFormSet(
+        queryset=confirmation.items.all(),
+        form_kwargs={'confirmation': confirmation})
+    # цены и варианты выбора подготовлены формсетом, отрисовка без запросов
+    with django_assert_num_queries(0):
+        product_select = str(formset.forms[0]['product'])
+    assert 'data-price="0.10"' in product_select
+    assert 'data-price="10.10"' in product_select
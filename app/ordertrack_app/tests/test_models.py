@@ -1,7 +1,11 @@
 import pytest
-from datetime import date
+from datetime import date, datetime
 from decimal import Decimal
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+
 from ..models import (
     Client,
     Supplier,
@@ -14,6 +18,12 @@ from ..models import (
     Confirmation,
     ConfirmationItem,
     ConfirmationDelivery,
+    Invoice,
+    InvoiceItem,
+    Cancellation,
+    CancellationItem,
+    FulfilmentLedger,
+    CurrentPrice,
 )
 
 
@@ -130,3 +140,238 @@ def test_confirmationdelivery_creation(confirmationdelivery, confirmations, prod
     assert confirmationdelivery0.quantity == 1
     assert confirmationdelivery0.product == products.get("0")
     assert confirmationdelivery0.confirmation.delivery_data.count() == 2
+
+
+@pytest.mark.parametrize("lines", [10, 100])
+@pytest.mark.django_db
+def test_save_order_items_query_count(lines, orders, clients, django_assert_num_queries):
+    order_data_json = [
+        {"product": f"P{i}_B0", "second_id": f"P{i}_B0",
+            "client": f"C{i % 2}", "quantity": i+1}
+        for i in range(lines)
+    ]
+    order_data_json.append(
+        {"product": "total", "second_id": "", "client": "", "quantity": 0})
+    # количество запросов не зависит от количества строк заказа:
+    # товары, позиции и пересчет журнала исполнения (6 запросов)
+    with django_assert_num_queries(9):
+        OrderItem.save_order_items(order_data_json, orders.get("2"))
+    assert OrderItem.objects.filter(order=orders.get("2")).count() == lines
+    assert Product.objects.get(id="P0_B0").second_id is None
+
+
+@pytest.mark.django_db
+def test_apply_order_revision(orders, clients, django_assert_num_queries):
+    order_data_json = [
+        {"product": f"P{i}_B0", "second_id": f"P{i}_B0",
+            "client": f"C{i % 2}", "quantity": i+1}
+        for i in range(100)
+    ]
+    OrderItem.save_order_items(order_data_json, orders.get("2"))
+    order_data_json[10]["quantity"] = 1000
+    # одна измененная строка - чтение заказа, одно обновление,
+    # пересчет журнала по одному ключу (чтение и обновление строки) и итогов заказа
+    with django_assert_num_queries(9):
+        summary = OrderItem.apply_order_revision(
+            order_data_json, orders.get("2"))
+    assert summary == {"added": 0, "updated": 1,
+                       "deleted": 0, "unchanged": 99}
+    del order_data_json[0]
+    order_data_json.append(
+        {"product": "P100_B0", "second_id": "P100_B0", "client": "C0", "quantity": 5})
+    summary = OrderItem.apply_order_revision(order_data_json, orders.get("2"))
+    assert summary == {"added": 1, "updated": 0,
+                       "deleted": 1, "unchanged": 99}
+    assert OrderItem.objects.get(
+        order=orders.get("2"), product_id="P10_B0").quantity == 1000
+    assert not OrderItem.objects.filter(
+        order=orders.get("2"), product_id="P0_B0").exists()
+
+
+@pytest.mark.django_db
+def test_get_left_quantity_per_product(confirmations, orderitems, confirmationitems, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        left_quantity_t0 = ConfirmationItem.get_left_quantity_per_product(
+            confirmations.get("0"))
+    assert left_quantity_t0 == {
+        "TESTPRODUCT0_B0": [{"client_id": "C0", "quantity": 30}],
+        "TESTPRODUCT1_B0": [{"client_id": "C1", "quantity": 40}],
+    }
+    left_quantity_t1 = ConfirmationItem.get_left_quantity_per_product(
+        confirmations.get("1"), products={"TESTPRODUCT0_B0"})
+    assert left_quantity_t1 == {
+        "TESTPRODUCT0_B0": [{"client_id": "C0", "quantity": 20}],
+    }
+
+
+@pytest.mark.django_db
+def test_reallocate_confirmation_items(orders, confirmations, orderitems, confirmationitems):
+    confirmation = confirmations.get("0")
+    # ручная правка строки товара, которого нет в добавляемом заказе
+    ConfirmationItem.objects.filter(
+        pk=confirmationitems.get("1").pk).update(quantity=25)
+    confirmation.order.add(orders.get("2"))
+    summary = ConfirmationItem.reallocate_confirmation_items(
+        confirmation, [orders.get("2")])
+    assert summary == {"products": 1, "added": 0, "updated": 1, "deleted": 0}
+    assert dict(confirmation.items.values_list("product_id", "quantity")) == {
+        "TESTPRODUCT0_B0": 60, "TESTPRODUCT1_B0": 25}
+
+
+@pytest.mark.parametrize("lines", [10, 50])
+@pytest.mark.django_db
+def test_save_confirmation_query_count(lines, confirmations, orderitems, django_assert_num_queries):
+    delivery_date = datetime(2026, 1, 1).timestamp()*1000
+    confirmation_data_json = [
+        {"product": f"P{i // 2}_B0", "product_name": f"P{i // 2}",
+            "quantity": 1, "price": 1.5, "delivery_date": delivery_date}
+        for i in range(lines)
+    ]
+    confirmation_data_json.append(
+        {"product": "", "product_name": "", "quantity": "", "price": "",
+            "delivery_date": ""})
+    confirmation = confirmations.get("1")
+    # распределение, товары, клиент Unknown (get_or_create), позиции,
+    # пересчет журнала, доставка
+    with django_assert_num_queries(15):
+        ConfirmationItem.save_confirmation_items(
+            confirmation_data_json, confirmation)
+        ConfirmationDelivery.save_confirmation_delivery(
+            confirmation_data_json, confirmation)
+    assert confirmation.items.count() == lines // 2
+    assert set(confirmation.items.values_list("quantity", flat=True)) == {2}
+    assert list(confirmation.delivery_data.values_list(
+        "delivery_date", "quantity").distinct()) == [(date(2026, 1, 1), 2)]
+
+
+@pytest.mark.django_db
+def test_fulfilment_ledger(supplier, orders, confirmationitems, orderitems, confirmations):
+    confirmation_item = confirmationitems.get("0")
+    invoice = Invoice.objects.create(name="I0", supplier=supplier)
+    InvoiceItem.objects.create(
+        invoice=invoice, confirmationitem=confirmation_item, quantity=4, price=1)
+    cancellation = Cancellation.objects.create(supplier=supplier)
+    CancellationItem.objects.create(
+        cancellation=cancellation, cancellation_item=confirmation_item, quantity=2)
+    ledger = {
+        (row.pop("order_id"), row.pop("client_id")): row
+        for row in FulfilmentLedger.objects.filter(
+            product="TESTPRODUCT0_B0").values(
+                "order_id", "client_id", "ordered", "confirmed", "invoiced", "cancelled", "open")
+    }
+    assert ledger == {
+        (orders.get("0").pk, "C0"): {"ordered": 10, "confirmed": 10, "invoiced": 4, "cancelled": 2, "open": 0},
+        (orders.get("1").pk, "C0"): {"ordered": 30, "confirmed": 0, "invoiced": 0, "cancelled": 0, "open": 30},
+        (orders.get("2").pk, "C0"): {"ordered": 50, "confirmed": 30, "invoiced": 0, "cancelled": 0, "open": 20},
+    }
+    call_command("rebuild_ledger", "--check")
+    confirmations.get("1").delete()
+    invoice.delete()
+    assert FulfilmentLedger.objects.get(
+        order=orders.get("2"), client="C0").open == 50
+    call_command("rebuild_ledger", "--check")
+    FulfilmentLedger.objects.update(open=0)
+    with pytest.raises(CommandError):
+        call_command("rebuild_ledger", "--check")
+    call_command("rebuild_ledger")
+    call_command("rebuild_ledger", "--check")
+
+
+@pytest.mark.django_db
+def test_fulfilment_ledger_refresh_keys(orders, clients, settings):
+    settings.LEDGER_CHUNK_SIZE = 3
+    OrderItem.save_order_items([
+        {"product": f"P{i}_B0", "second_id": f"P{i}_B0",
+            "client": f"C{i % 2}", "quantity": i+1}
+        for i in range(20)
+    ], orders.get("2"))
+    before = {
+        (client_id, product_id): (pk, ordered)
+        for pk, client_id, product_id, ordered in FulfilmentLedger.objects.values_list(
+            "id", "client_id", "product_id", "ordered")
+    }
+    OrderItem.objects.filter(client="C0").update(quantity=F("quantity") + 100)
+    # пересчет по кускам только ключей клиента C0, строки обновляются на месте
+    FulfilmentLedger.refresh({key for key in before if key[0] == "C0"})
+    after = {
+        (client_id, product_id): (pk, ordered)
+        for pk, client_id, product_id, ordered in FulfilmentLedger.objects.values_list(
+            "id", "client_id", "product_id", "ordered")
+    }
+    assert after.keys() == before.keys()
+    for key, (pk, ordered) in before.items():
+        assert after[key] == (pk, ordered + 100 if key[0] == "C0" else ordered)
+    assert not FulfilmentLedger.find_mismatches()
+
+
+@pytest.mark.django_db
+def test_document_totals(orders, orderitems, confirmations, confirmationitems):
+    order = Order.objects.get(pk=orders.get("0").pk)
+    assert (order.quantity_total, order.lines_count) == (30, 2)
+    confirmation = Confirmation.objects.get(pk=confirmations.get("0").pk)
+    assert (confirmation.amount_total, confirmation.lines_count) == (Decimal("203.00"), 2)
+    item = orderitems.get("0")
+    item.quantity += 5
+    item.save()
+    order.comment = "stale totals are not saved"
+    order.save()
+    order.refresh_from_db()
+    assert order.quantity_total == 35 == order.total_quantity
+    confirmationitems.get("0").delete()
+    confirmation.refresh_from_db()
+    assert confirmation.lines_count == 1
+    assert confirmation.amount_total == confirmation.total_amount
+    call_command("recompute_totals", "--check")
+    Order.objects.update(quantity_total=0)
+    with pytest.raises(CommandError):
+        call_command("recompute_totals", "--check")
+    call_command("recompute_totals")
+    call_command("recompute_totals", "--check")
+
+
+@pytest.mark.django_db
+def test_match_invoice_lines(supplier, confirmations, clients, brands, django_assert_num_queries):
+    Product.objects.bulk_create(
+        [Product(id=f"P{i}_B0", brand_id="B0") for i in range(2500)])
+    ConfirmationItem.objects.bulk_create([
+        ConfirmationItem(confirmation=confirmations.get(str(i % 2)), client_id=f"C{i % 2}",
+                         product_id=f"P{i // 2}_B0", quantity=4, price=1.5)
+        for i in range(5000)])
+    invoice_data_json = [
+        {"product": f"P{i // 2}_B0", "client": f"C{i % 2}" if i % 3 else "",
+         "quantity": 3, "price": 1.5}
+        for i in range(5000)]
+    # одна выборка открытых строк подтверждений на весь счет
+    with django_assert_num_queries(1):
+        items, report = InvoiceItem.match_invoice_lines(supplier, invoice_data_json)
+    assert {row["status"] for row in report} == {"matched"}
+    assert sum(item.quantity for item in items) == 15000
+
+
+@pytest.mark.django_db
+def test_current_prices(supplier, products, pricelist, productdetail):
+    product = products.get("0")
+
+    def current():
+        return dict(CurrentPrice.objects.values_list('product_id', 'price'))
+    assert current() == {product.pk: Decimal("1.01")}
+    later = PriceList.objects.create(supplier=supplier, starts_from=date(2100, 1, 1))
+    ProductDetail.objects.create(product=product, pricelist=later, price=2)
+    ProductDetail.objects.create(product=products.get("1"), pricelist=later, price=3)
+    assert current() == {product.pk: Decimal("2.00"), products.get("1").pk: Decimal("3.00")}
+    assert CurrentPrice.lookup([product.pk], supplier) == {product.pk: Decimal("2.00")}
+    later.state = PriceList.State.INVALID
+    later.save()
+    assert current() == {product.pk: Decimal("1.01")}
+    productdetail.product = products.get("1")
+    productdetail.save()
+    assert current() == {products.get("1").pk: Decimal("1.01")}
+    pricelist.delete()
+    assert current() == {}
+    call_command("rebuild_prices", "--check")
+    later.state = PriceList.State.VALID
+    PriceList.objects.filter(pk=later.pk).update(state=later.state)
+    with pytest.raises(CommandError):
+        call_command("rebuild_prices", "--check")
+    call_command("rebuild_prices")
+    assert len(current()) == 2
@@ -0,0 +1,25 @@
+import pytest
+import os
+import time
+
+import pandas as pd
+
+from .. import staging
+from ..tasks import clean_staging
+
+
+def test_clean_staging(staging_root):
+    expired_token = staging.stage(pd.DataFrame({"product": ["P0_B0"]}))
+    fresh_token = staging.stage(pd.DataFrame({"product": ["P1_B0"]}))
+    expired_time = time.time() - 2 * 24 * 60 * 60
+    os.utime(staging.staging_path(expired_token),
+             (expired_time, expired_time))
+    result = clean_staging()
+    assert result["removed"] == 1
+    assert staging.load(expired_token) is None
+    assert staging.load(fresh_token)["product"].tolist() == ["P1_B0"]
+
+
+@pytest.mark.parametrize("token", ["", None, "../../etc/passwd", "short"])
+def test_staging_rejects_invalid_token(token):
+    assert staging.load(token) is None
@@ -1,14 +1,32 @@
 import pytest
+import zipfile
 from decimal import Decimal
 from datetime import date
+from io import BytesIO
+from openpyxl import load_workbook
 
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.db.models import Sum
 
 from ..models import (
+    Client,
+    Supplier,
+    Product,
+    ProductDetail,
+    PriceList,
     Order,
     OrderItem,
     Confirmation,
     ConfirmationItem,
+    ConfirmationDelivery,
+    ImportJob,
+    Invoice,
+    InvoiceItem,
+    FulfilmentLedger,
+    CurrentPrice,
 )
 
 import logging
@@ -184,7 +202,9 @@ def test_order_create(client, order_excel, clients, supplier):
         'name': "Order 3-C0-B0-T00016-01-01-2025.xlsx",
         'order_date': date(2025, 1, 1),
         'supplier_id': 'T00016',
-        'comment': None
+        'comment': None,
+        'quantity_total': 30,
+        'lines_count': 2,
     }]
     expected_items = [
         {'id': 1,
@@ -240,7 +260,10 @@ def test_confirmation_create(client, confirmation_excel, orders, supplier, order
         'name': "Confirmation B0 010125.xlsx",
         'confirmation_date': date(2025, 1, 1),
         'supplier_id': 'T00016',
-        'comment': None
+        'comment': None,
+        'quantity_total': 30,
+        'amount_total': Decimal('501.40'),
+        'lines_count': 2,
     }]
     expected_items = [
         {'id': 1,
@@ -292,3 +315,490 @@ def test_confirmation_view(client, confirmations, confirmationitems):
         assert item.client.id.encode() in response.content
         assert str(item.quantity).encode() in response.content
         assert str(item.price).encode() in response.content
+
+
+@pytest.mark.django_db
+def test_order_import_job(client, order_excel, clients, supplier, celery_eager):
+    url = reverse('addorder')
+    response = client.get(url)
+    data = {
+        'csrfmiddlewaretoken': response.context['csrf_token'],
+        'name': [order_excel.name],
+        'order_date': "2025-01-01",
+        'supplier': [supplier.id],
+        'comment': [''],
+        'action': ['import'],
+        'file': order_excel
+    }
+    response = client.post(url, data=data)
+    job = ImportJob.objects.get()
+    assert response.status_code == 302
+    assert response.url == reverse('importjob', kwargs={'pk': job.pk})
+    response = client.get(reverse('importjobstatus', kwargs={'pk': job.pk}))
+    status = response.json()
+    order_id = Order.name_into_id(order_excel.name)
+    assert status["status"] == "Success"
+    assert status["rows_parsed"] == 2
+    assert status["rows_written"] == 2
+    assert status["errors"] == []
+    assert status["duration"] >= 0
+    assert status["url"] == reverse('vieworder', kwargs={'pk': order_id})
+    assert OrderItem.objects.filter(order=order_id).count() == 2
+
+
+@pytest.mark.django_db
+def test_confirmation_import_job(client, confirmation_excel, orders, supplier, orderitems, celery_eager):
+    url = reverse('addconfirmation')
+    response = client.get(url)
+    data = {
+        'csrfmiddlewaretoken': response.context['csrf_token'],
+        'name': [confirmation_excel.name],
+        'confirmation_date': ["2025-01-01"],
+        'confirmation_code': ['Preview'],
+        'supplier': [supplier.id],
+        'order': [orders.get('0').id],
+        'comment': [''],
+        'action': ['import'],
+        'file': [confirmation_excel]
+    }
+    client.post(url, data=data)
+    job = ImportJob.objects.get()
+    assert job.status == ImportJob.Status.SUCCESS
+    assert job.object_id == "T3"
+    assert job.rows_parsed == 2
+    assert job.rows_written == 2
+    assert ConfirmationItem.objects.filter(confirmation="T3").count() == 2
+    response = client.get(reverse('importjob', kwargs={'pk': job.pk}))
+    assert response.status_code == 200
+    assert b"Success" in response.content
+
+
+@pytest.mark.django_db
+def test_confirmation_preview_staging(client, confirmation_excel, orders, supplier, orderitems, staging_root):
+    url = reverse('addconfirmation')
+    response = client.get(url)
+    data = {
+        'csrfmiddlewaretoken': response.context['csrf_token'],
+        'name': [confirmation_excel.name],
+        'confirmation_date': ["2025-01-01"],
+        'confirmation_code': ['Preview'],
+        'supplier': [supplier.id],
+        'order': [orders.get('0').id],
+        'comment': [''],
+        'action': ['preview'],
+        'file': [confirmation_excel]
+    }
+    client.post(url, data=data)
+    token = client.session['confirmation_data_token']
+    assert 'confirmation_data_json' not in client.session
+    assert [path.stem for path in staging_root.iterdir()] == [token]
+    data.update({
+        'confirmation_code': ['T3'],
+        'file': [''],
+        'action': ['add'],
+    })
+    client.post(url, data=data)
+    delivery_data = list(ConfirmationDelivery.objects.filter(
+        confirmation="T3").values_list('product', 'delivery_date', 'quantity'))
+    assert delivery_data == [('TESTPRODUCT0_B0', date(2026, 1, 1), 10)]
+    assert 'confirmation_data_token' not in client.session
+    assert list(staging_root.iterdir()) == []
+
+
+@pytest.mark.django_db
+def test_order_batch_import(client, create_test_excel, clients, supplier, orders):
+    data = {'product': ['P0', 'P1'], 'quantity': [10, 20], 'note': ['C0', 'C1']}
+    first_excel = next(create_test_excel(
+        data, filename="Order 4-C0-B0-T00016-01-02-2025.xlsx"))
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        second_excel = next(create_test_excel(
+            data, filename="Order 5-C0-B0-T00016-01-03-2025.xlsx"))
+        zip_file.writestr(f"batch/{second_excel.name}", second_excel.read())
+        zip_file.writestr(orders.get("0").name, second_excel.file.getvalue())
+        zip_file.writestr("Order 6-C0-B0-T00016-01-03-2025.xlsx", b"broken")
+        zip_file.writestr("readme.txt", b"")
+        # одноименный файл второй раз не загружается
+        zip_file.writestr(f"copy/{second_excel.name}", second_excel.file.getvalue())
+    url = reverse('addorders')
+    response = client.post(url, data={
+        'files': [first_excel, SimpleUploadedFile("orders.zip", archive.getvalue())],
+    })
+    report = response.context["report"]
+    assert [(row["status"], row["rows"]) for row in report] == [
+        ("created", 2), ("created", 2), ("skipped", 0), ("error", 0), ("skipped", 0)]
+    assert report[3]["message"].startswith("Cannot upload data")
+    assert not ImportJob.objects.exists()
+    new_order = Order.objects.get(pk="Order 5-C0-B0-T00016-01-03-2025")
+    assert new_order.order_date == date(2025, 3, 1)
+    assert new_order.supplier_id == "T00016"
+    assert new_order.items.count() == 2
+    assert new_order.quantity_total == 30
+    assert not Order.objects.filter(pk__startswith="Order 6").exists()
+    assert not FulfilmentLedger.find_mismatches()
+
+
+@pytest.mark.django_db
+def test_order_revision(client, create_test_excel, orders, orderitems):
+    order = orders.get("0")
+    data = {
+        'product': ['TESTPRODUCT0', 'P2'],
+        'quantity': [15, 5],
+        'note': ['C0', 'C0']
+    }
+    revision_excel = next(create_test_excel(
+        data, filename="Order 0-C0-B0-T00016-01-01-2025.xlsx"))
+    url = reverse('editorder', kwargs={'pk': order.pk})
+    response = client.post(
+        url, data={'revision': [''], 'file': revision_excel}, follow=True)
+    assert "Revision is applied: 1 added, 1 updated, 1 deleted, 0 unchanged" in [
+        str(message) for message in response.context["messages"]]
+    assert dict(order.items.values_list("product_id", "quantity")) == {
+        "TESTPRODUCT0_B0": 15, "P2_B0": 5}
+
+
+@pytest.mark.django_db
+def test_order_revision_confirmed(client, create_test_excel, orders, orderitems, confirmations):
+    order = orders.get("0")
+    items = list(order.items.values_list("product_id", "quantity"))
+    revision_excel = next(create_test_excel(
+        {'product': ['P2'], 'quantity': [5], 'note': ['C0']},
+        filename="Order 0-C0-B0-T00016-01-01-2025.xlsx"))
+    response = client.post(reverse('editorder', kwargs={'pk': order.pk}),
+                           data={'revision': [''], 'file': revision_excel}, follow=True)
+    assert "Order has confirmations, items cannot be changed" in [
+        str(message) for message in response.context["messages"]]
+    assert list(order.items.values_list("product_id", "quantity")) == items
+
+
+@pytest.mark.django_db
+def test_edit_pages_query_count(client, orders, clients, products, confirmations):
+    def count_queries(url_name, pk):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse(url_name, kwargs={'pk': pk}))
+        assert response.status_code == 200
+        return len(context), response
+
+    order = orders.get("0")
+    confirmation = confirmations.get("0")
+    OrderItem.objects.create(order=order, client=clients.get(
+        "0"), product=products.get("0"), quantity=1)
+    ConfirmationItem.objects.create(confirmation=confirmation, client=clients.get(
+        "0"), product=products.get("0"), quantity=1, price=1)
+    order_queries, _ = count_queries('editorder', order.pk)
+    confirmation_queries, _ = count_queries('editconfirmation', confirmation.pk)
+    for i in range(10):
+        product = Product.objects.create(
+            id=f"EXTRA{i}_B0", name=f"Extra {i}", brand_id="B0")
+        OrderItem.objects.create(
+            order=order, client=clients.get("1"), product=product, quantity=1)
+        ConfirmationItem.objects.create(
+            confirmation=confirmation, client=clients.get("1"), product=product, quantity=1, price=1)
+    # варианты выбора общие для всех строк, число запросов не растет
+    assert count_queries('editorder', order.pk)[0] == order_queries
+    queries, response = count_queries('editconfirmation', confirmation.pk)
+    assert queries == confirmation_queries
+    assert b'<option value="EXTRA9_B0" selected' in response.content
+
+
+@pytest.mark.django_db
+def test_confirmation_detail_read_only(client, confirmations, confirmationitems, django_assert_max_num_queries):
+    confirmation = confirmations.get("0")
+    with django_assert_max_num_queries(10):
+        response = client.get(
+            reverse('viewconfirmation', kwargs={'pk': confirmation.pk}))
+    assert "formset" not in response.context
+    assert [(item["product_id"], item["total_price"]) for item in response.context["items"]] == [
+        ("TESTPRODUCT0_B0", Decimal("1.00")), ("TESTPRODUCT1_B0", Decimal("202.00"))]
+    assert response.context["total_amount"] == Decimal("203.00")
+    # сумма выводится с двумя знаками без floatformat
+    content = response.content.decode()
+    assert "<td>C1 Test client 1</td>" in content
+    assert "<td>202.00</td>" in content
+
+
+@pytest.mark.django_db
+def test_confirmation_items_api(client, confirmations, confirmationitems):
+    url = reverse('confirmationitemsapi', kwargs={'pk': "T0"})
+    first_page = client.get(url, {"limit": 1}).json()
+    assert [item["id"] for item in first_page["items"]] == [
+        confirmationitems.get("0").id]
+    second_page = client.get(
+        url, {"limit": 1, "after": first_page["next"]}).json()
+    assert [item["product"] for item in second_page["items"]] == [
+        "TESTPRODUCT1_B0"]
+    assert second_page["next"] is None
+    for limit in (0, -3):
+        response = client.get(url, {"limit": limit})
+        assert response.status_code == 400
+        assert response.json()["errors"] == ["limit must be positive"]
+
+    def patch(*operations):
+        return client.patch(url, data={"operations": list(operations)},
+                            content_type="application/json")
+
+    line_id = confirmationitems.get("0").id
+    response = patch({"op": "split", "id": line_id,
+                     "client": "C1", "quantity": 4})
+    assert response.status_code == 200
+    assert [(item["client"], item["quantity"]) for item in response.json()["items"]] == [
+        ("C0", 6), ("C1", 4)]
+    response = patch({"op": "quantity", "id": line_id, "quantity": 7})
+    assert response.status_code == 400
+    assert response.json()["errors"] == ["Must be 10 of TESTPRODUCT0_B0"]
+    response = patch({"op": "reassign", "id": line_id, "client": "C1"})
+    assert response.json()["errors"] == ["Product-Client must be distinct."]
+    split_id = ConfirmationItem.objects.get(
+        confirmation="T0", product="TESTPRODUCT0_B0", client="C1").id
+    response = patch({"op": "delete", "id": split_id},
+                     {"op": "quantity", "id": line_id, "quantity": 10})
+    assert response.status_code == 200
+    assert ConfirmationItem.objects.filter(
+        confirmation="T0", product="TESTPRODUCT0_B0").count() == 1
+    # обмен клиентами двух строк одного товара за один запрос
+    other = ConfirmationItem.objects.create(
+        confirmation_id="T0", client_id="C1", product_id="TESTPRODUCT0_B0", quantity=3, price=1)
+    response = patch({"op": "reassign", "id": line_id, "client": "C1"},
+                     {"op": "reassign", "id": other.id, "client": "C0"})
+    assert response.status_code == 200
+    assert dict(ConfirmationItem.objects.filter(
+        confirmation="T0", product="TESTPRODUCT0_B0").values_list("id", "client_id")) == {
+        line_id: "C1", other.id: "C0"}
+
+
+@pytest.mark.django_db
+def test_order_list_totals(client, orders, orderitems, django_assert_max_num_queries):
+    url = reverse('orders')
+    with django_assert_max_num_queries(4):
+        response = client.get(url, {"sort": "-quantity_total"})
+    totals = [order.quantity_total for order in response.context["orders"]]
+    assert totals == sorted(totals, reverse=True)
+    response = client.get(url, {"min_total": "31", "max_total": "bad"})
+    assert all(order.quantity_total >= 31 for order in response.context["orders"])
+    assert orders.get("0") not in response.context["orders"]
+    response = client.get(url, {"min_total": "nan", "max_total": "Infinity"})
+    assert response.status_code == 200
+    assert len(response.context["orders"]) == len(orders)
+
+
+@pytest.mark.django_db
+def test_confirmation_export(client, confirmations, confirmationitems, supplier):
+    confirmation = confirmations.get("0")
+    url = reverse('exportconfirmationtoexcel', kwargs={'pk': confirmation.pk})
+    response = client.get(url, {"format": "csv"})
+    lines = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+    assert lines[0].split(",")[:3] == ["client", "client_name", "product"]
+    assert len(lines) == 1 + confirmation.items.count()
+    response = client.post(url)
+    workbook = load_workbook(BytesIO(b"".join(response.streaming_content)))
+    assert workbook.active.max_row == 1 + confirmation.items.count()
+
+    response = client.get(reverse('exportconfirmations'),
+                          {"supplier": supplier.pk, "format": "csv"})
+    archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+    assert sorted(archive.namelist()) == sorted(
+        f"{pk}.csv" for pk in Confirmation.objects.values_list("pk", flat=True))
+    assert archive.read(f"{confirmation.pk}.csv").decode("utf-8-sig").splitlines() == lines
+    response = client.get(reverse('exportconfirmations'), {"supplier": supplier.pk})
+    archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+    assert all(name.endswith(".xlsx") for name in archive.namelist())
+    response = client.get(reverse('exportconfirmations'), {"date_from": "bad"})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_invoice_create(client, invoice_excel, supplier, orderitems, confirmationitems):
+    url = reverse('addinvoice')
+    response = client.post(url, data={
+        'name': '', 'invoice_date': '2025-01-02', 'supplier': supplier.pk,
+        'comment': '', 'file': invoice_excel})
+    invoice = Invoice.objects.get(name="R100")
+    report = response.context["report"]
+    assert [(row["status"], row["matched"]) for row in report] == [
+        ("partial", 10), ("matched", 25), ("unmatched", 0)]
+    assert [row["message"] for row in report] == [
+        "5 not matched to confirmations, not saved", "",
+        "5 not matched to confirmations, not saved"]
+    # несопоставленные остатки не сохраняются строками без подтверждения
+    items = sorted(InvoiceItem.objects.filter(invoice=invoice).values_list(
+        "confirmationitem_id", "quantity"))
+    assert items == [(confirmationitems.get("0").pk, 10),
+                     (confirmationitems.get("3").pk, 25)]
+    assert FulfilmentLedger.objects.aggregate(total=Sum("invoiced"))["total"] == 10
+    assert not FulfilmentLedger.find_mismatches()
+
+
+@pytest.mark.django_db
+def test_reconciliation_report(client, supplier, orders, orderitems, confirmationitems,
+                               django_assert_max_num_queries,
+                               django_capture_on_commit_callbacks):
+    confirmation_item = confirmationitems.get("0")
+    invoice = Invoice.objects.create(name="I0", supplier=supplier)
+    InvoiceItem.objects.create(
+        invoice=invoice, confirmationitem=confirmation_item, quantity=4, price=1)
+    url = reverse('reconciliation')
+    response = client.get(url, {"supplier": supplier.pk, "all_pairs": "on"})
+    summary = response.context["summary"]
+    assert response.context["shown"] == summary["pairs"] >= summary["mismatches"] > 0
+    assert summary["invoice_price"] == 1
+    assert "invoice_price" in str(response.context["rows"])
+    # повторный запрос берет отчет из кэша: читается только версия данных
+    with django_assert_max_num_queries(3):
+        client.get(url, {"supplier": supplier.pk})
+    # версия данных меняется только после фиксации транзакции
+    with django_capture_on_commit_callbacks(execute=True):
+        InvoiceItem.objects.create(
+            invoice=invoice, confirmationitem=confirmation_item, quantity=6,
+            price=confirmation_item.price)
+    response = client.get(url, {"supplier": supplier.pk, "format": "xlsx"})
+    workbook = load_workbook(BytesIO(b"".join(response.streaming_content)))
+    rows = list(workbook.active.values)
+    assert rows[0][:3] == ("client", "product", "ordered")
+    invoiced = {(row[0], row[1]): row[4] for row in rows[1:]}
+    assert invoiced[(confirmation_item.client_id, confirmation_item.product_id)] == 10
+
+
+@pytest.mark.django_db
+def test_reconciliation_cache_documents(client, supplier, orders, orderitems, confirmationitems,
+                                        django_capture_on_commit_callbacks):
+    url = reverse('reconciliation')
+
+    def ordered():
+        response = client.get(url, {"supplier": supplier.pk, "all_pairs": "on"})
+        return sum(row["ordered"] for row in response.context["rows"])
+    before = ordered()
+    version = FulfilmentLedger.data_version()
+    # счет без сопоставленных строк не меняет журнал, но меняет версию данных
+    with django_capture_on_commit_callbacks(execute=True):
+        invoice = Invoice.objects.create(name="I1", supplier=supplier)
+        InvoiceItem.save_invoice_items(
+            [{"product": "UNKNOWN_B0", "client": "", "quantity": 1, "price": 1}], invoice)
+    assert FulfilmentLedger.data_version() > version
+    # смена поставщика заказа убирает его строки из отчета прежнего поставщика
+    order = orders.get("0")
+    order.supplier = Supplier.objects.create(id="T00099", name="Other")
+    with django_capture_on_commit_callbacks(execute=True):
+        order.save()
+    assert ordered() == before - order.items.aggregate(total=Sum("quantity"))["total"]
+
+
+@pytest.mark.django_db
+def test_product_list_keyset(client, brands, supplier, pricelist, settings, django_assert_max_num_queries):
+    settings.DIRECTORY_PAGE_SIZE = 3
+    Product.objects.bulk_create([
+        Product(id=f"P{i}_B{i % 2}", brand_id=f"B{i % 2}",
+                state=Product.State.INVALID if i == 4 else Product.State.VALID)
+        for i in range(8)])
+    ProductDetail.objects.bulk_create([
+        ProductDetail(product_id=f"P{i}_B{i % 2}", pricelist=pricelist, price=i)
+        for i in range(8)])
+    CurrentPrice.refresh([f"P{i}_B{i % 2}" for i in range(8)], [supplier])
+    url = reverse('products')
+    seen, query = [], ""
+    while query is not None:
+        # товары страницы и последние цены только для них
+        with django_assert_max_num_queries(4):
+            response = client.get(f"{url}?{query}")
+        seen.extend(product.id for product in response.context["products"])
+        query = response.context.get("next_page_query")
+    assert seen == sorted(seen, key=lambda product_id: (product_id[-2:], product_id))
+    assert len(seen) == 8
+    response = client.get(url, {"brand": "B0", "state": "Valid"})
+    assert [product.id for product in response.context["products"]] == ["P0_B0", "P2_B0", "P6_B0"]
+    assert response.context["products"][0].prefetched_prices[0].price == 0
+
+
+@pytest.mark.django_db
+def test_pricelist_import_job(client, pricelist_excel, supplier, products, settings, celery_eager):
+    settings.EXCEL_CHUNK_SIZE = 2
+    url = reverse('addpricelist')
+    response = client.get(url)
+    data = {
+        'csrfmiddlewaretoken': response.context['csrf_token'],
+        'supplier': [supplier.id],
+        'pricelist_date': ["2025-01-01"],
+        'starts_from': ["2025-01-01"],
+        'state': [PriceList.State.VALID],
+        'comment': [''],
+        'file': [pricelist_excel],
+    }
+    client.post(url, data=data)
+    job = ImportJob.objects.get()
+    assert job.status == ImportJob.Status.SUCCESS, job.errors
+    assert (job.rows_parsed, job.rows_written) == (3, 2)
+    pricelist = PriceList.objects.get(pk=job.object_id)
+    assert dict(pricelist.products.values_list('product_id', 'price')) == {
+        "TESTPRODUCT0_B0": Decimal("1.50"), "NEW1_B1": Decimal("2.25")}
+    product = Product.objects.get(pk="NEW1_B1")
+    assert (product.name, product.description, product.brand_id) == ("new 1", "Second", "B1")
+    # существующий товар прайс-листом не переписывается
+    product = Product.objects.get(pk="TESTPRODUCT0_B0")
+    assert (product.name, product.description) == ("Test product 0", None)
+    assert CurrentPrice.lookup(["TESTPRODUCT0_B0", "NEW1_B1"], supplier) == {
+        "TESTPRODUCT0_B0": Decimal("1.50"), "NEW1_B1": Decimal("2.25")}
+
+
+@pytest.mark.django_db
+def test_product_search(client, admin_client, brands, settings, django_assert_max_num_queries):
+    settings.SEARCH_PAGE_SIZE = 2
+    Product.objects.bulk_create([
+        Product(id="ABC1_B0", name="abc.1", brand_id="B0"),
+        Product(id="XABC1_B0", name="x-abc-1", brand_id="B0"),
+        Product(id="ABC12_B1", second_id="Q77_B1", name="Gear abc 12", brand_id="B1"),
+        Product(id="ZZZ_B1", name="Other", brand_id="B1"),
+    ])
+    url = reverse('searchproducts')
+    with django_assert_max_num_queries(1):
+        response = client.get(url, {"q": "abc-1"}).json()
+    # точное совпадение кода - первым, затем вхождения по порядку id
+    assert [product["id"] for product in response["results"]] == ["ABC1_B0", "ABC12_B1"]
+    assert [product["exact"] for product in response["results"]] == [True, False]
+    response = client.get(url, {"q": "abc-1", "page": response["next"]}).json()
+    assert [product["id"] for product in response["results"]] == ["XABC1_B0"]
+    assert response["next"] is None
+    assert [product["id"] for product in client.get(url, {"q": "q77"}).json()["results"]] == ["ABC12_B1"]
+    # индекс следует за изменениями таблицы товаров
+    Product.objects.filter(pk="ZZZ_B1").update(name="new gear")
+    Product.objects.filter(pk="XABC1_B0").delete()
+    assert [product["id"] for product in client.get(url, {"q": "gear"}).json()["results"]] == [
+        "ABC12_B1", "ZZZ_B1"]
+    assert [product["id"] for product in client.get(url, {"q": "abc1"}).json()["results"]] == [
+        "ABC1_B0", "ABC12_B1"]
+    response = client.get(reverse('products'), {"q": "gear"})
+    assert [product.id for product in response.context["products"]] == ["ABC12_B1", "ZZZ_B1"]
+    # в админке при поиске тот же порядок: точное совпадение кода первым
+    Product.objects.create(id="ABC_B1", name="abc", brand_id="B1")
+    url = reverse('admin:ordertrack_app_product_changelist')
+    response = admin_client.get(url, {"q": "ABC"})
+    assert [product.id for product in response.context["cl"].result_list] == [
+        "ABC_B1", "ABC12_B1", "ABC1_B0"]
+    # сортировка по столбцу id важнее порядка совпадения
+    response = admin_client.get(url, {"q": "ABC", "o": "1"})
+    assert [product.id for product in response.context["cl"].result_list] == [
+        "ABC12_B1", "ABC1_B0", "ABC_B1"]
+    # без поиска - обычный порядок списка, по бренду
+    response = admin_client.get(url)
+    assert [product.id for product in response.context["cl"].result_list] == [
+        "ABC1_B0", "ABC12_B1", "ABC_B1", "ZZZ_B1"]
+
+
+@pytest.mark.django_db
+def test_autocomplete(client, orders, orderitems, clients, supplier, settings, django_assert_max_num_queries):
+    settings.AUTOCOMPLETE_LIMIT = 1
+    url = reverse('autocomplete', kwargs={'model': 'client'})
+    with django_assert_max_num_queries(1):
+        response = client.get(url, {"q": "c"})
+    assert response.json() == {"results": [{"id": "C0", "text": "Test client 0"}]}
+    assert client.get(url, {"q": "Test client 1"}).json()["results"][0]["id"] == "C1"
+    # регистр названия не важен
+    assert client.get(url, {"q": "tEST CLIENT 1"}).json()["results"][0]["id"] == "C1"
+    response = client.get(reverse('autocomplete', kwargs={'model': 'product'}), {"q": "testproduct-1"})
+    assert [result["id"] for result in response.json()["results"]] == ["TESTPRODUCT1_B0"]
+    assert client.get(reverse('autocomplete', kwargs={'model': 'brand'})).status_code == 404
+    # в строках формсета только выбранные варианты, справочник целиком не выводится
+    Client.objects.bulk_create([Client(id=f"X{i}", name=f"Extra {i}") for i in range(50)])
+    response = client.get(reverse('editorder', kwargs={'pk': orders.get("0").pk}))
+    content = response.content.decode()
+    assert "Extra 1" not in content
+    assert '<option value="C0" selected>Test client 0</option>' in content
+    assert 'data-autocomplete-url="/autocomplete/client/"' in content
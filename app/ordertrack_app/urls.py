@@ -1,17 +1,24 @@
 from django.urls import path
 
-from .views import views, directories, orders, confirmations, invoices
+from .views import views, directories, orders, confirmations, invoices, imports, reports
 
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path('autocomplete/<str:model>/', views.autocomplete, name="autocomplete"),
     path('clients/', directories.ClientListView.as_view(), name="clients"),
     path('brands/', directories.BrandListView.as_view(), name="brands"),
     path('suppliers/', directories.SupplierListView.as_view(), name="suppliers"),
     path('products/', directories.ProductListView.as_view(), name="products"),
+    path('products/search/', directories.search_products_api,
+         name="searchproducts"),
+    path('pricelists/add', directories.PriceListCreateView.as_view(),
+         name="addpricelist"),
 
     path('orders/', orders.OrderListView.as_view(), name="orders"),
     path('orders/add', orders.OrderCreateView.as_view(), name="addorder"),
+    path('orders/addbatch', orders.OrderBatchCreateView.as_view(),
+         name="addorders"),
     path('orders/<str:pk>', orders.OrderDetailView.as_view(), name="vieworder"),
     path('orders/<str:pk>/edit/',
          orders.OrderUpdateView.as_view(), name="editorder"),
@@ -20,6 +27,8 @@ urlpatterns = [
 
     path('confirmations/', confirmations.ConfirmationListView.as_view(),
          name="confirmations"),
+    path('confirmations/export/', confirmations.export_confirmations,
+         name="exportconfirmations"),
     path('confirmation/add', confirmations.ConfirmationCreateView.as_view(),
          name="addconfirmation"),
     path('confirmations/<str:pk>',
@@ -29,8 +38,17 @@ urlpatterns = [
     path('confirmations/<str:pk>/edit/',
          confirmations.ConfirmationUpdateView.as_view(), name="editconfirmation"),
 
+    path('confirmations/<str:pk>/items/',
+         confirmations.confirmation_items_api, name="confirmationitemsapi"),
     path('confirmations/<str:pk>/exporttoexcel/',
-         confirmations.export_to_excel, name="exportconfirmationtoexcel"),
+         confirmations.export_confirmation, name="exportconfirmationtoexcel"),
     path('invoices/', invoices.invoices, name="invoices"),
+    path('invoices/add', invoices.InvoiceCreateView.as_view(), name="addinvoice"),
     path('invoices/<str:invoice_id>', invoices.invoice_items, name="invoiceitems"),
+
+    path('reports/reconciliation/', reports.reconciliation, name="reconciliation"),
+
+    path('imports/<uuid:pk>', imports.import_job, name="importjob"),
+    path('imports/<uuid:pk>/status/',
+         imports.import_job_status, name="importjobstatus"),
 ]
@@ -1,21 +1,30 @@
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.db import transaction
-from django.http import HttpResponse
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_http_methods
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import F
 
 from pathlib import Path
 import json
 
-from ..models import Confirmation, ConfirmationItem, ConfirmationDelivery
+from ..models import Confirmation, ConfirmationItem, ConfirmationDelivery, ImportJob, FulfilmentLedger, CurrentPrice
 from ..forms.confirmations import (
     ConfirmationModelForm,
     EditConfirmationModelForm,
     ViewConfirmationModelForm,
     ViewConfirmationItemFormSet,
-    EditConfirmationItemFormSet)
+    EditConfirmationItemFormSet,
+    ExportConfirmationsForm)
 from ..forms.uploadfile import UploadConfirmationForm
+from .imports import start_import_job
+from .. import exports
+from .views import TotalsListMixin, client_label
+from .. import staging
 
 import logging
 
@@ -24,43 +33,59 @@ log = logging.getLogger(__name__)
 template_path = Path("ordertrack_app") / "confirmations"
 
 
-class ConfirmationListView(ListView):
+class ConfirmationListView(TotalsListMixin, ListView):
     model = Confirmation
     template_name = template_path/"confirmations.html"
     context_object_name = "confirmations"
+    sort_fields = ("confirmation_date", "quantity_total", "amount_total", "lines_count")
+    default_ordering = ("-confirmation_date", "name")
+    total_field = "amount_total"
 
     def get_queryset(self):
-        return super().get_queryset().order_by("-confirmation_date", "name")
+        return super().get_queryset().prefetch_related("order")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['export_form'] = ExportConfirmationsForm()
+        return context
 
 
 class ConfirmationDetailView(DetailView):
     model = Confirmation
     model_item = ConfirmationItem
     form_class = ViewConfirmationModelForm
-    formset_class = ViewConfirmationItemFormSet
     template_name = template_path/"viewconfirmation.html"
     context_object_name = 'viewconfirmation'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        confirmation = self.get_object()
-        confirmation_items = self.model_item.objects.select_related(
-            'client',
-            'product'
-        ).filter(
-            confirmation=confirmation)
-        confirmation_form = self.form_class(instance=confirmation)
-        confirmation_items_formset = self.formset_class(
-            queryset=confirmation_items,
-            form_kwargs={'confirmation': confirmation})
-        non_client_products = list(confirmation_items.filter(
-            client_id="Unknown").values_list('product', flat=True))
+        # только чтение: строки одним запросом values(), без формсета
+        items = list(self.model_item.objects.filter(
+            confirmation=self.object
+        ).order_by('pk').values(
+            'client_id', 'product_id', 'quantity', 'price', client_label=client_label()))
+        # цена приходит с двумя знаками, произведение на целое их сохраняет:
+        # в шаблоне сумма выводится как есть, без floatformat
+        for item in items:
+            item['total_price'] = item['quantity'] * item['price']
+        non_client_products = [
+            item['product_id'] for item in items if item['client_id'] == "Unknown"]
         if non_client_products:
             messages.error(
                 self.request, f"Products have no client data : {', '.join(non_client_products)}")
+        # сверка с текущими ценами поставщика - точечное чтение CurrentPrice
+        current_prices = CurrentPrice.lookup(
+            {item['product_id'] for item in items}, self.object.supplier_id)
+        changed_prices = sorted({
+            item['product_id'] for item in items
+            if current_prices.get(item['product_id'], item['price']) != item['price']})
+        if changed_prices:
+            messages.warning(
+                self.request, f"Prices differ from current price lists : {', '.join(changed_prices)}")
         context.update({
-            'confirmation_form': confirmation_form,
-            'formset': confirmation_items_formset,
+            'confirmation_form': self.form_class(instance=self.object),
+            'items': items,
+            'total_amount': self.object.amount_total,
             'view_confirmation': True,
         })
         return context
@@ -98,6 +123,7 @@ class ConfirmationUpdateView(UpdateView):
         context.update({
             'confirmation_form': self.get_form(),
             'formset': formset,
+            'total_amount': confirmation.amount_total,
             'view_confirmation': False,
         })
         return context
@@ -105,29 +131,15 @@ class ConfirmationUpdateView(UpdateView):
     def get_success_url(self):
         return reverse_lazy('viewconfirmation', kwargs={'pk': self.object.pk})
 
-    def order_has_changed(self, form):
-        order = form.cleaned_data["order"]
-        initial_order = self.get_object().order.all()
-        if len(order) == len(initial_order):
-            for item in order:
-                if item not in initial_order:
-                    return True
-            return False
-        else:
-            return True
-
-    def apply_new_order(self, confirmation):
-        confirmation_data_json = list(confirmation.items.annotate(
-            product_name=F('product__name')
-        ).values(
-            'product',
-            'quantity',
-            'price',
-            'product_name'
-        ))
-        confirmation.items.all().delete()
-        self.model_item.save_confirmation_items(
-            confirmation_data_json, confirmation)
+    def changed_orders(self, form):
+        # заказы, добавленные в подтверждение или удаленные из него
+        order = set(form.cleaned_data["order"])
+        initial_order = set(self.get_object().order.all())
+        return order ^ initial_order
+
+    def apply_new_order(self, confirmation, changed_orders):
+        return self.model_item.reallocate_confirmation_items(
+            confirmation, changed_orders)
 
     def form_valid(self, form):
         context = self.get_context_data()
@@ -136,17 +148,25 @@ class ConfirmationUpdateView(UpdateView):
             formset = self.formset_class(
                 self.request.POST, form_kwargs={'confirmation': confirmation})
             if form.is_valid() and formset.is_valid():
-                order_has_changed = self.order_has_changed(form)
-                form.save()
-                if order_has_changed:
-                    self.apply_new_order(confirmation)
+                changed_orders = self.changed_orders(form)
+                with transaction.atomic():
+                    form.save()
+                    if changed_orders:
+                        summary = self.apply_new_order(
+                            confirmation, changed_orders)
+                if changed_orders:
                     messages.warning(
-                        self.request, f'New order has been applied to set clients')
+                        self.request,
+                        "New order has been applied to set clients: "
+                        "{products} products, {added} added, {updated} updated, "
+                        "{deleted} deleted".format(**summary))
                     return super().form_valid(form)
-                formset.save(commit=False)
-                for obj in formset.deleted_objects:
-                    obj.delete()
-                formset.save()
+                # журнал и итоги подтверждения пересчитываются один раз на формсет
+                with FulfilmentLedger.deferred():
+                    formset.save(commit=False)
+                    for obj in formset.deleted_objects:
+                        obj.delete()
+                    formset.save()
                 return super().form_valid(form)
             else:
                 context.update({
@@ -195,7 +215,9 @@ class ConfirmationCreateView(CreateView):
                     }
                     form.instance.confirmation_code = confirmation_code
                     form.save(commit=False)
-                    self.request.session['confirmation_data_json'] = loadform.data_json(
+                    staging.discard(
+                        self.request.session.get('confirmation_data_token'))
+                    self.request.session['confirmation_data_token'] = staging.stage(
                         confirmation_data)
                     context.update({
                         'form': self.form_class(instance=form.instance, initial=current_values),
@@ -214,10 +236,20 @@ class ConfirmationCreateView(CreateView):
                     'add_order_disabled': True,
                 })
             return self.render_to_response(context)
+        elif action == 'import':
+            if response := start_import_job(self.request, form, ImportJob.Kind.CONFIRMATION):
+                return response
+            return self.render_to_response(context)
         elif action == 'add':
             if form.is_valid() and loadform.is_valid():
-                confirmation_data_json = json.loads(
-                    self.request.session.get('confirmation_data_json'))
+                confirmation_data_token = self.request.session.get(
+                    'confirmation_data_token')
+                confirmation_data = staging.load(confirmation_data_token)
+                if confirmation_data is None:
+                    messages.error(
+                        self.request, 'Uploaded data has expired. Preview file again')
+                    return self.render_to_response(context)
+                confirmation_data_json = confirmation_data.to_dict('records')
                 try:
                     with transaction.atomic():
                         confirmation = form.save(commit=False)
@@ -233,25 +265,90 @@ class ConfirmationCreateView(CreateView):
                         'add_order_disabled': True,
                     })
                     return self.render_to_response(context)
-                del self.request.session['confirmation_data_json']
+                staging.discard(confirmation_data_token)
+                del self.request.session['confirmation_data_token']
                 messages.success(self.request, 'Order is created')
                 return super().form_valid(form)
 
 
-def export_to_excel(request, confirmation_id):
-    confirmation = Confirmation.objects.get(id=confirmation_id)
-    confirmation_items = ConfirmationItem.objects.filter(
-        confirmation_id=confirmation_id).order_by("-client_id")
-    formset = ViewConfirmationItemFormSet(queryset=confirmation_items, form_kwargs={
-        'confirmation': confirmation})
-    excel_file = formset.export_to_excel()
-    if excel_file:
-        excel_response = HttpResponse(
-            excel_file.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={
-                'Content-Disposition': 'attachment; filename="data.xlsx"'
-            }
-        )
-        return excel_response
-    return HttpResponse()
+def export_confirmation(request, pk):
+    # файл строится прямо из курсора, без формсета
+    confirmation = get_object_or_404(Confirmation, pk=pk)
+    file_format = request.GET.get("format") or request.POST.get("format") or "xlsx"
+    if file_format == "csv":
+        response = StreamingHttpResponse(
+            exports.csv_chunks(exports.confirmation_rows(confirmation.pk)),
+            content_type=exports.CONTENT_TYPES["csv"])
+        response["Content-Disposition"] = f'attachment; filename="{confirmation.pk}.csv"'
+        return response
+    return FileResponse(
+        exports.excel_file(exports.confirmation_rows(confirmation.pk)),
+        as_attachment=True, filename=f"{confirmation.pk}.xlsx",
+        content_type=exports.CONTENT_TYPES["xlsx"])
+
+
+def export_confirmations(request):
+    # архив подтверждений поставщика за период, файлы пишутся в поток по одному
+    form = ExportConfirmationsForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    response = StreamingHttpResponse(
+        exports.confirmations_zip_chunks(
+            form.confirmation_ids(), form.cleaned_data["format"]),
+        content_type=exports.CONTENT_TYPES["zip"])
+    response["Content-Disposition"] = 'attachment; filename="confirmations.zip"'
+    return response
+
+
+def confirmation_item_as_dict(item):
+    return {
+        "id": item["id"],
+        "client": item["client_id"],
+        "client_name": item["client__name"],
+        "product": item["product_id"],
+        "quantity": item["quantity"],
+        "price": str(item["price"]),
+    }
+
+
+@require_http_methods(["GET", "PATCH"])
+def confirmation_items_api(request, pk):
+    confirmation = get_object_or_404(Confirmation, pk=pk)
+    if request.method == "PATCH":
+        try:
+            operations = json.loads(request.body).get("operations")
+            with transaction.atomic():
+                items = ConfirmationItem.apply_line_operations(
+                    confirmation, operations)
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({"errors": ["Body must be a JSON object"]}, status=400)
+        except ValidationError as e:
+            return JsonResponse({"errors": e.messages}, status=400)
+        except IntegrityError as e:
+            return JsonResponse({"errors": [str(e)]}, status=400)
+        return JsonResponse({"items": [
+            confirmation_item_as_dict(item) for item in ConfirmationItem.objects.filter(
+                id__in=[item.id for item in items]
+            ).order_by('id').values('id', 'client_id', 'client__name', 'product_id', 'quantity', 'price')
+        ]})
+    # keyset-пагинация: следующая страница начинается после последнего id
+    try:
+        after = int(request.GET.get("after", 0))
+        limit = min(int(request.GET.get("limit", settings.API_PAGE_SIZE)),
+                    settings.API_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"errors": ["after and limit must be integers"]}, status=400)
+    if limit < 1:
+        return JsonResponse({"errors": ["limit must be positive"]}, status=400)
+    items = ConfirmationItem.objects.filter(
+        confirmation=confirmation, id__gt=after)
+    if product := request.GET.get("product"):
+        items = items.filter(product_id=product)
+    items = list(items.order_by('id').values(
+        'id', 'client_id', 'client__name', 'product_id', 'quantity', 'price')[:limit + 1])
+    has_next = len(items) > limit
+    items = items[:limit]
+    return JsonResponse({
+        "items": [confirmation_item_as_dict(item) for item in items],
+        "next": items[-1]["id"] if has_next else None,
+    })
@@ -1,46 +1,110 @@
-from django.views.generic import ListView
-from django.db.models import Prefetch, Window, F
-from django.db.models.functions import RowNumber
+from django.views.generic import ListView, CreateView
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.conf import settings
 
 from pathlib import Path
 
-from ..models import Client, Supplier, Brand, Product, ProductDetail
+from ..models import Client, Supplier, Brand, Product, PriceList, CurrentPrice, ImportJob
+from ..forms.directories import ProductFilterForm
+from ..forms.pricelists import PriceListModelForm
+from ..forms.uploadfile import UploadPriceListForm
+from ..search import search_products
+from .imports import start_import_job
+from .views import KeysetListMixin
 
 template_path = Path("ordertrack_app") / "directories"
 
 
-class ClientListView(ListView):
+class ClientListView(KeysetListMixin, ListView):
     model = Client
     template_name = template_path/"clients.html"
     context_object_name = "clients"
 
 
-class BrandListView(ListView):
+class BrandListView(KeysetListMixin, ListView):
     model = Brand
     template_name = template_path/"brands.html"
     context_object_name = "brands"
 
 
-class SupplierListView(ListView):
+class SupplierListView(KeysetListMixin, ListView):
     model = Supplier
     template_name = template_path/"suppliers.html"
     context_object_name = "suppliers"
 
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related("brand")
+
 
-class ProductListView(ListView):
+class ProductListView(KeysetListMixin, ListView):
     model = Product
     template_name = template_path/"products.html"
     context_object_name = "products"
+    keyset_fields = ("brand_id", "id")
+
+    def get_filter_form(self):
+        if not hasattr(self, "filter_form"):
+            self.filter_form = ProductFilterForm(self.request.GET)
+        return self.filter_form
 
     def get_queryset(self):
-        return super().get_queryset().prefetch_related(
-            Prefetch("details",
-                     queryset=ProductDetail.objects.annotate(
-                         row_num=Window(
-                             expression=RowNumber(),
-                             partition_by=[F("product_id"), F(
-                                 "pricelist__supplier_id")],
-                             order_by=[F("pricelist__starts_from").desc()]
-                         )).filter(row_num=1),
-                     to_attr='prefetched_details')
-        ).order_by("brand", "id")
+        # текущие цены поставщиков хранятся в CurrentPrice, по строке на пару
+        return self.get_filter_form().filter(
+            super().get_queryset()
+        ).select_related("brand").prefetch_related(
+            Prefetch("current_prices",
+                     queryset=CurrentPrice.objects.select_related(
+                         "supplier").order_by("supplier__name"),
+                     to_attr='prefetched_prices'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.get_filter_form()
+        return context
+
+
+class PriceListCreateView(CreateView):
+    model = PriceList
+    form_class = PriceListModelForm
+    loadform_class = UploadPriceListForm
+    template_name = template_path/"addpricelist.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'loadform': self.loadform_class(),
+            'title': 'New Price List',
+        })
+        return context
+
+    def form_valid(self, form):
+        # большой прайс-лист загружается в фоне, страница задачи показывает ход
+        if response := start_import_job(self.request, form, ImportJob.Kind.PRICELIST):
+            return response
+        return self.render_to_response(self.get_context_data(form=form))
+
+
+def search_products_api(request):
+    # страницы без COUNT: берется на одну строку больше
+    query = request.GET.get("q", "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        return JsonResponse({"errors": ["page must be an integer"]}, status=400)
+    if not query:
+        return JsonResponse({"results": [], "next": None})
+    size = settings.SEARCH_PAGE_SIZE
+    start = (page - 1) * size
+    products = list(search_products(query).values(
+        'id', 'second_id', 'name', 'brand_id', 'rank')[start:start + size + 1])
+    return JsonResponse({
+        "results": [{
+            "id": product["id"],
+            "second_id": product["second_id"],
+            "name": product["name"],
+            "brand": product["brand_id"],
+            "exact": product["rank"] == 0,
+        } for product in products[:size]],
+        "next": page + 1 if len(products) > size else None,
+    })
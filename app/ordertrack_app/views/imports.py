@@ -0,0 +1,42 @@
+from django.shortcuts import render, get_object_or_404, redirect
+from django.http import JsonResponse
+from django.contrib import messages
+
+from pathlib import Path
+
+from ..models import ImportJob
+from ..tasks import process_import_job
+
+import logging
+
+log = logging.getLogger(__name__)
+
+template_path = Path("ordertrack_app") / "imports"
+
+
+def start_import_job(request, form, kind):
+    uploaded_file = request.FILES.get('file')
+    if not uploaded_file:
+        messages.error(request, f'No file selected. Choose file')
+        return None
+    job = ImportJob.objects.create(
+        kind=kind,
+        file=uploaded_file,
+        filename=uploaded_file.name,
+        form_data={name: request.POST.getlist(name) for name in form.fields},
+    )
+    process_import_job.delay(str(job.pk))
+    return redirect('importjob', pk=job.pk)
+
+
+def import_job(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    context = {
+        "job": job,
+    }
+    return render(request, template_path/"importjob.html", context=context)
+
+
+def import_job_status(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    return JsonResponse(job.as_dict())
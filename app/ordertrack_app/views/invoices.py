@@ -1,8 +1,13 @@
 from django.shortcuts import render, get_list_or_404
+from django.views.generic import CreateView
+from django.db import transaction
+from django.contrib import messages
 
 from pathlib import Path
 
 from ..models import Invoice, InvoiceItem
+from ..forms.invoices import InvoiceModelForm
+from ..forms.uploadfile import UploadInvoiceForm
 
 import logging
 
@@ -25,3 +30,45 @@ def invoice_items(request, invoice_id):
         "invoiceitems": invoice_items
     }
     return render(request, template_path/"invoiceitems.html", context=context)
+
+
+class InvoiceCreateView(CreateView):
+    model = Invoice
+    model_item = InvoiceItem
+    form_class = InvoiceModelForm
+    loadform_class = UploadInvoiceForm
+    template_name = template_path/"addinvoice.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'loadform': kwargs.get('loadform') or self.loadform_class(),
+            'title': 'New Invoice',
+        })
+        return context
+
+    def form_valid(self, form):
+        loadform = self.loadform_class(self.request.POST, self.request.FILES)
+        uploaded_file = self.request.FILES.get('file')
+        if not uploaded_file:
+            messages.error(self.request, f'No file selected. Choose file')
+            return self.render_to_response(self.get_context_data(form=form))
+        try:
+            invoice_number, invoice_data = loadform.load_excel_invoice(
+                uploaded_file, supplier=form.cleaned_data["supplier"])
+            with transaction.atomic():
+                invoice = form.save(commit=False)
+                invoice.name = invoice.name or str(invoice_number)
+                invoice.save()
+                report = self.model_item.save_invoice_items(
+                    invoice_data.to_dict('records'), invoice)
+        except Exception as e:
+            messages.error(
+                self.request, f'Cannot upload data from {uploaded_file}, {str(e)}')
+            return self.render_to_response(self.get_context_data(form=form))
+        self.object = invoice
+        matched = sum(row["status"] == "matched" for row in report)
+        messages.success(
+            self.request, f"Invoice is created: {matched} of {len(report)} lines are matched")
+        return self.render_to_response(self.get_context_data(
+            form=self.form_class(), invoice=invoice, report=report))
@@ -1,13 +1,13 @@
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
 from django.urls import reverse_lazy
 from django.db import transaction
 from django.contrib import messages
 from django.shortcuts import redirect
+from django.core.files.base import ContentFile
 
 from pathlib import Path
-import json
 
-from ..models import Order, OrderItem
+from ..models import Order, OrderItem, ImportJob, Supplier, FulfilmentLedger
 from ..forms.orders import (
     OrderModelForm,
     EditOrderModelForm,
@@ -15,7 +15,10 @@ from ..forms.orders import (
     ViewOrderItemFormSet,
     EditOrderItemFormSet,
 )
-from ..forms.uploadfile import UploadOrderForm
+from ..forms.uploadfile import UploadOrderForm, UploadOrderBatchForm
+from .imports import start_import_job
+from .views import TotalsListMixin, client_label
+from .. import staging
 
 import logging
 
@@ -24,35 +27,36 @@ log = logging.getLogger(__name__)
 template_path = Path("ordertrack_app") / "orders"
 
 
-class OrderListView(ListView):
+class OrderListView(TotalsListMixin, ListView):
     model = Order
     template_name = template_path/"orders.html"
     context_object_name = "orders"
+    sort_fields = ("order_date", "quantity_total", "lines_count")
+    default_ordering = ("-order_date", "name")
+    total_field = "quantity_total"
 
     def get_queryset(self):
-        return super().get_queryset().order_by("-order_date", "name")
+        return super().get_queryset().prefetch_related("confirmations")
 
 
 class OrderDetailView(DetailView):
     model = Order
     model_item = OrderItem
     form_class = ViewOrderModelForm
-    formset_class = ViewOrderItemFormSet
     template_name = template_path/"vieworder.html"
     context_object_name = 'vieworder'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        order = self.get_object()
-        order_items = self.model_item.objects.select_related(
-            'client',
-            'product'
-        ).filter(order=order)
-        order_form = self.form_class(instance=order)
-        formset = self.formset_class(queryset=order_items)
+        # только чтение: строки одним запросом values(), без формсета
+        items = list(self.model_item.objects.filter(
+            order=self.object
+        ).order_by('pk').values(
+            'product_id', 'quantity', client_label=client_label()))
         context.update({
-            'order_form': order_form,
-            'formset': formset,
+            'order_form': self.form_class(instance=self.object),
+            'items': items,
+            'total_quantity': self.object.quantity_total,
             'view_order': True,
         })
         return context
@@ -79,6 +83,7 @@ class OrderUpdateView(UpdateView):
     form_class = EditOrderModelForm
     formset_class = EditOrderItemFormSet
     formset_class_not_allowed = ViewOrderItemFormSet
+    loadform_class = UploadOrderForm
     template_name = template_path/"vieworder.html"
     context_object_name = 'editorder'
 
@@ -98,12 +103,46 @@ class OrderUpdateView(UpdateView):
         context.update({
             'order_form': self.get_form(),
             'formset': formset,
+            'total_quantity': order.quantity_total,
+            'loadform': self.loadform_class(),
         })
         return context
 
     def get_success_url(self):
         return reverse_lazy('vieworder', kwargs={'pk': self.object.pk})
 
+    def post(self, request, *args, **kwargs):
+        if 'revision' in request.POST:
+            self.object = self.get_object()
+            return self.apply_revision()
+        return super().post(request, *args, **kwargs)
+
+    def apply_revision(self):
+        # позиции заказа с подтверждениями не меняются, как и в form_valid
+        if self.object.confirmations.exists():
+            messages.error(
+                self.request, 'Order has confirmations, items cannot be changed')
+            return redirect('editorder', pk=self.object.pk)
+        uploaded_file = self.request.FILES.get('file')
+        if not uploaded_file:
+            messages.error(self.request, f'No file selected. Choose file')
+            return redirect('editorder', pk=self.object.pk)
+        try:
+            order_data = self.loadform_class.load_excel_order(
+                uploaded_file, supplier=self.object.supplier)
+            with transaction.atomic():
+                summary = self.model_item.apply_order_revision(
+                    order_data.to_dict('records'), self.object)
+        except Exception as e:
+            messages.error(
+                self.request, f'Cannot apply revision from {uploaded_file}, {str(e)}')
+            return redirect('editorder', pk=self.object.pk)
+        messages.success(
+            self.request,
+            "Revision is applied: {added} added, {updated} updated, "
+            "{deleted} deleted, {unchanged} unchanged".format(**summary))
+        return redirect(self.get_success_url())
+
     def form_valid(self, form):
         context = self.get_context_data()
         if 'save' in self.request.POST:
@@ -126,10 +165,12 @@ class OrderUpdateView(UpdateView):
                     initial=[{'order': self.get_object()}],)
                 if form.is_valid() and formset.is_valid():
                     form.save()
-                    formset.save(commit=False)
-                    for obj in formset.deleted_objects:
-                        obj.delete()
-                    formset.save()
+                    # журнал и итоги заказа пересчитываются один раз на формсет
+                    with FulfilmentLedger.deferred():
+                        formset.save(commit=False)
+                        for obj in formset.deleted_objects:
+                            obj.delete()
+                        formset.save()
                     messages.success(
                         self.request, "Order and items are updated")
                     return super().form_valid(form)
@@ -172,7 +213,9 @@ class OrderCreateView(CreateView):
                     supplier = form.cleaned_data["supplier"]
                     order_data = loadform.load_excel_order(
                         uploaded_file, supplier=supplier)
-                    self.request.session['order_data_json'] = loadform.data_json(
+                    staging.discard(
+                        self.request.session.get('order_data_token'))
+                    self.request.session['order_data_token'] = staging.stage(
                         order_data)
                     context.update({
                         'orderdata': order_data,
@@ -190,10 +233,19 @@ class OrderCreateView(CreateView):
                     'add_order_disabled': True,
                 })
             return self.render_to_response(context)
+        elif action == 'import':
+            if response := start_import_job(self.request, form, ImportJob.Kind.ORDER):
+                return response
+            return self.render_to_response(context)
         elif action == 'add':
             if form.is_valid() and loadform.is_valid():
-                order_data_json = json.loads(
-                    self.request.session.get('order_data_json'))
+                order_data_token = self.request.session.get('order_data_token')
+                order_data = staging.load(order_data_token)
+                if order_data is None:
+                    messages.error(
+                        self.request, 'Uploaded data has expired. Preview file again')
+                    return self.render_to_response(context)
+                order_data_json = order_data.to_dict('records')
                 try:
                     with transaction.atomic():
                         order = form.save()
@@ -205,6 +257,77 @@ class OrderCreateView(CreateView):
                         'add_order_disabled': True,
                     })
                     return self.render_to_response(context)
-                del self.request.session['order_data_json']
+                staging.discard(order_data_token)
+                del self.request.session['order_data_token']
                 messages.success(self.request, 'Order is created')
                 return super().form_valid(form)
+
+
+class OrderBatchCreateView(FormView):
+    form_class = UploadOrderBatchForm
+    template_name = template_path/"addorders.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'title': 'Import orders',
+        })
+        return context
+
+    def form_valid(self, form):
+        files = form.expand_files(form.cleaned_data["files"])
+        suppliers = Supplier.objects.in_bulk()
+        existing = set(Order.objects.filter(
+            id__in=[form.file_order_fields(name)["id"] for name, _ in files]
+        ).values_list("id", flat=True))
+        report, orders_data, accepted = [], [], set()
+        for name, content in files:
+            order_fields = form.file_order_fields(name)
+            order_fields["order_date"] = order_fields["order_date"] or form.cleaned_data["order_date"]
+            supplier = suppliers.get(order_fields["supplier_id"]) or form.cleaned_data["supplier"]
+            row = {"file": name, "order": order_fields["id"],
+                   "status": "error", "rows": 0, "message": ""}
+            report.append(row)
+            if order_fields["id"] in existing or order_fields["id"] in accepted:
+                row.update(status="skipped", message="There is order with such name")
+                continue
+            if supplier is None:
+                row["message"] = "Supplier is not defined"
+                continue
+            if order_fields["order_date"] is None:
+                row["message"] = "Order date is not defined"
+                continue
+            try:
+                order_data = UploadOrderForm.load_excel_order(
+                    ContentFile(content, name=name), supplier=supplier)
+            except Exception as e:
+                row["message"] = f"Cannot upload data, {e}"
+                continue
+            accepted.add(order_fields["id"])
+            order_fields["supplier_id"] = supplier.id
+            orders_data.append((row, Order(**order_fields), order_data.to_dict('records')))
+
+        # все заказы пакета - одна транзакция, каждый заказ - в своей точке сохранения,
+        # журнал и итоги пересчитываются один раз в конце
+        saved = []
+        try:
+            with transaction.atomic(), FulfilmentLedger.deferred():
+                for row, order, order_data_json in orders_data:
+                    try:
+                        with transaction.atomic():
+                            order.save(force_insert=True)
+                            order_items = OrderItem.save_order_items(
+                                order_data_json=order_data_json, order=order)
+                    except Exception as e:
+                        row["message"] = f"Cannot save data, {e}"
+                        continue
+                    row.update(status="created", rows=len(order_items))
+                    saved.append(row)
+        except Exception as e:
+            for row in saved:
+                row.update(status="error", rows=0, message=f"Cannot save data, {e}")
+            saved = []
+        messages.success(
+            self.request, f"{len(saved)} of {len(report)} orders are created")
+        return self.render_to_response(self.get_context_data(
+            form=form, report=report))
@@ -0,0 +1,40 @@
+from django.shortcuts import render
+from django.http import FileResponse
+
+from pathlib import Path
+
+from ..forms.reports import ReconciliationForm
+from .. import exports, reconciliation as reconciliation_report
+
+import logging
+
+log = logging.getLogger(__name__)
+
+template_path = Path("ordertrack_app") / "reports"
+
+
+def reconciliation(request):
+    # сверка заказано / подтверждено / в счетах / отменено по поставщику
+    form = ReconciliationForm(request.GET or None)
+    context = {"form": form}
+    if form.is_valid():
+        supplier = form.cleaned_data["supplier"]
+        report, summary = reconciliation_report.supplier_report(supplier.id)
+        if request.GET.get("format") == "xlsx":
+            rows = report.astype(object).where(report.notna(), None)
+            return FileResponse(
+                exports.excel_file(rows.itertuples(index=False, name=None),
+                                   header=reconciliation_report.COLUMNS),
+                as_attachment=True, filename=f"reconciliation-{supplier.id}.xlsx",
+                content_type=exports.CONTENT_TYPES["xlsx"])
+        if not form.cleaned_data["all_pairs"]:
+            report = report[report["flags"] != ""]
+        rows = report.to_dict("records")
+        context.update({
+            "supplier": supplier,
+            "summary": summary,
+            "flags": reconciliation_report.FLAGS,
+            "rows": rows,
+            "shown": len(report),
+        })
+    return render(request, template_path/"reconciliation.html", context=context)
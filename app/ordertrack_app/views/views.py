@@ -1,13 +1,116 @@
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 from pathlib import Path
 from django.shortcuts import render
+from django.conf import settings
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Coalesce
+from django.http import JsonResponse, Http404
 
 import pandas as pd
 from pathlib import Path
 
+from .. import search
+
 template_path = Path("ordertrack_app")
 
 
 def index(request):
     context = {"now": datetime.now()}
     return render(request, template_path/"index.html",  context=context)
+
+
+def autocomplete(request, model):
+    # варианты для AutocompleteSelect: первые AUTOCOMPLETE_LIMIT по префиксу
+    if model not in search.AUTOCOMPLETE:
+        raise Http404(f"No autocomplete for {model}")
+    return JsonResponse({"results": search.autocomplete(
+        model, request.GET.get("q", ""), settings.AUTOCOMPLETE_LIMIT)})
+
+
+def client_label():
+    # "id название" клиента собирается в запросе, а не фильтрами в шаблоне
+    return Concat("client_id", Value(" "), Coalesce("client__name", Value("")))
+
+
+class TotalsListMixin:
+    """
+    Список документов с сохраненными итогами: сортировка ?sort=поле или -поле
+    из sort_fields, фильтр ?min_total= и ?max_total= по total_field.
+    """
+    sort_fields = ()
+    default_ordering = ()
+    total_field = None
+
+    def get_total_filter(self):
+        bounds = {}
+        for param, lookup in (("min_total", "gte"), ("max_total", "lte")):
+            try:
+                value = Decimal(self.request.GET[param])
+            except (KeyError, InvalidOperation):
+                continue
+            # nan и infinity база сравнить не может
+            if value.is_finite():
+                bounds[f"{self.total_field}__{lookup}"] = value
+        return bounds
+
+    def get_queryset(self):
+        queryset = super().get_queryset().filter(**self.get_total_filter())
+        sort = self.request.GET.get("sort", "")
+        if sort.lstrip("-") in self.sort_fields:
+            return queryset.order_by(sort, *self.default_ordering)
+        return queryset.order_by(*self.default_ordering)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'sort': self.request.GET.get("sort", ""),
+            'min_total': self.request.GET.get("min_total", ""),
+            'max_total': self.request.GET.get("max_total", ""),
+        })
+        return context
+
+
+class KeysetListMixin:
+    """
+    Постраничный список без OFFSET: страница начинается после ключа
+    последней строки предыдущей (?after=... по каждому полю keyset_fields).
+    """
+    keyset_fields = ("pk",)
+
+    def get_paginate_by(self, queryset):
+        return settings.DIRECTORY_PAGE_SIZE
+
+    def get_after(self):
+        after = self.request.GET.getlist("after")
+        return after if len(after) == len(self.keyset_fields) else None
+
+    def keyset_filter(self, after):
+        # (a, b) > (x, y)  =>  a > x или (a = x и b > y)
+        condition = Q()
+        for i, field in enumerate(self.keyset_fields):
+            condition |= Q(**dict(zip(self.keyset_fields[:i], after[:i])),
+                           **{f"{field}__gt": after[i]})
+        return condition
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by(*self.keyset_fields)
+        if after := self.get_after():
+            queryset = queryset.filter(self.keyset_filter(after))
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        # строка сверх страницы показывает, есть ли следующая
+        page = list(queryset[:page_size + 1])
+        return None, None, page[:page_size], len(page) > page_size
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.copy()
+        query.pop("after", None)
+        context["first_page_query"] = query.urlencode() if self.get_after() else None
+        if context["is_paginated"] and (page := context["object_list"]):
+            query.setlist("after", [str(getattr(page[-1], field))
+                                    for field in self.keyset_fields])
+            context["next_page_query"] = query.urlencode()
+        return context